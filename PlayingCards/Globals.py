@@ -1,12 +1,28 @@
 APP_NAME = 'PlayCards'
 IMAGE_ROOT = 'images'
 CARD_ROOT = 'cards'
+CATALOGUE_ROOT = 'catalogues'
+SAVE_ROOT = 'saves'
+LOG_ROOT = 'logs'
+# the move logs are written only if this environment variable is set.
+LOG_ENV = 'PLAYCARDS_LOG'
+# the number of the logs kept for each game, the oldest removed first
+MAX_LOGS = 100
+# no sound is played if this environment variable is set.
+SILENT_ENV = 'PLAYCARDS_SILENT'
 
 CLOSE = 'Close'
 PYRAMID = 'Pyramid'
 CLOVER = 'FourLeafClover'
 KLONEDIKE = 'Klonedike'
 RULES = 'Rules'
+DEAL = 'Deal'
+WINNABLE = 'Winnable Deals'
+DIFFICULTY = 'Difficulty'
+NO_CATALOGUED_DEAL = '(no winnable deal catalogued)'
+UNDO = 'Undo'
+REDO = 'Redo'
+HINT = 'Hint'
 COUPLE = 'Couple'
 
 PIN = 'pin'
@@ -17,7 +33,11 @@ PAD = '0.75'
 BOARD_WIDTH = 1000
 BOARD_HEIGHT = 600
 BOARD_COLOR = 'green'
-MOVE_SPEED = 1
+# milliseconds a card takes to reach its destination
+MOVE_DURATION = 200
+# milliseconds between a card and the next one starting to move
+MOVE_STAGGER = 80
+FRAME_RATE = 60
 PIN_OFFSET_X = 18
 PIN_OFFSET_y = 30
 
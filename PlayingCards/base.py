@@ -1,21 +1,72 @@
+import itertools
 import os
 import pathlib
-import random
+import sys
+import time
 import tkinter as tk
-from collections import namedtuple
+from collections import Counter, namedtuple
 
+from engine import saves, seeds
+from engine.movelog import MoveLog
+from engine.catalogue import Catalogue, CatalogueError
+from engine.history import History
+from engine.cards import Card, JOCKER_VALUE, encode
 from Globals import (BACK, PIN, BOARD_HEIGHT, BOARD_WIDTH, BOARD_COLOR,
-    IMAGE_ROOT, CARD_ROOT, PIN_OFFSET_X, PIN_OFFSET_y)
+    IMAGE_ROOT, CARD_ROOT, CATALOGUE_ROOT, SAVE_ROOT, LOG_ROOT, LOG_ENV,
+    MAX_LOGS, DEAL, NO_CATALOGUED_DEAL, PIN_OFFSET_X, PIN_OFFSET_y,
+    FRAME_RATE, MOVE_DURATION, MOVE_STAGGER)
 
 
-CardFace = namedtuple('CardFace', 'image mark value')
+class CardFace(namedtuple('CardFace', 'image mark value')):
+
+    __slots__ = ()
+
+    @property
+    def card(self):
+        """The card used by the engine."""
+        return Card(self.mark, self.value)
+
+
+class FaceRegistry:
+    """Decode every card image only once and share the faces among the decks.
+       Faces are loaded at the first request, after the tk root is created.
+    """
+
+    _faces = None
+    _codes = None
+
+    @classmethod
+    def faces(cls):
+        if cls._faces is None:
+            parent_dir = pathlib.Path(__file__).parent.resolve()
+            cards_dir = parent_dir / CARD_ROOT
+            faces = []
+            for path in cards_dir.iterdir():
+                mark, value = path.stem.split('_')
+                faces.append(CardFace(tk.PhotoImage(file=path), mark, int(value)))
+            cls._faces = tuple(sorted(faces, key=lambda x: (x.mark, x.value)))
+        return cls._faces
+
+    @classmethod
+    def from_codes(cls, codes):
+        """Return the faces of the card codes of engine.cards.encode."""
+        if cls._codes is None:
+            faces = {encode(face.card): face for face in cls.faces() if face.value != JOCKER_VALUE}
+            cls._codes = tuple(faces[code] for code in range(len(faces)))
+        return [cls._codes[code] for code in codes]
 
 
 class Deck:
 
     def __init__(self):
-        parent_dir = pathlib.Path(__file__).parent.resolve()
-        self.cards_dir = parent_dir / CARD_ROOT
+        self._faces = tuple(self.get_cards())
+        self._deck = list(self._faces)
+
+    def get_cards(self):
+        """Override this method in subclasses to
+           select the faces used in the game.
+        """
+        yield from FaceRegistry.faces()
 
     def __getitem__(self, position):
         return self._deck[position]
@@ -23,8 +74,19 @@ class Deck:
     def __len__(self):
         return len(self._deck)
 
-    def shuffle(self):
-        random.shuffle(self._deck)
+    def shuffle(self, deal_id=None):
+        """Shuffle the faces in the order of the deal number, a new one
+           if not given, and return the deal number.
+        """
+        if deal_id is None:
+            deal_id = seeds.new_deal_id()
+        self._deck = list(self._faces)
+        seeds.shuffle(self._deck, deal_id)
+        return deal_id
+
+    def arrange(self, codes):
+        """Put the faces in the order of the card codes, a row of engine.deals.deal_codes."""
+        self._deck = FaceRegistry.from_codes(codes)
 
 
 class BaseCard:
@@ -52,35 +114,540 @@ class BaseCard:
     def image(self):
         return self.face.image
 
+    @property
+    def card(self):
+        return self.face.card
+
+
+def common_length(pile, previous):
+    """Return the number of the cards at the bottom of a pile which are
+       the same as the previous pile, without comparing a shared pile.
+    """
+    if pile is previous:
+        return len(pile)
+    n = min(len(pile), len(previous))
+    for i in range(n):
+        if pile[i] != previous[i]:
+            return i
+    return n
+
+
+def ease_out(t):
+    return 1 - (1 - t) ** 3
+
+
+class Tween:
+
+    __slots__ = ('item', 'x', 'y', 'start_x', 'start_y', 'dest_x', 'dest_y',
+                 'start', 'duration', 'callback')
+
+    def __init__(self, item, destination, start, duration, callback):
+        self.item = item
+        self.dest_x, self.dest_y = destination
+        self.start = start
+        self.duration = duration
+        self.callback = callback
+        # the position is read when the tween starts.
+        self.x = self.y = self.start_x = self.start_y = None
+
+
+class Animation:
+    """Move canvas items to their destinations in a fixed time. All of
+       the moving items are moved together in one tick of the frame rate.
+    """
+
+    clock = staticmethod(time.perf_counter)
+
+    def __init__(self, canvas, fps=FRAME_RATE, easing=ease_out):
+        self.canvas = canvas
+        self.interval = max(1, round(1000 / fps))
+        self.easing = easing
+        self.tweens = []
+        self.job = None
+
+    @property
+    def running(self):
+        return bool(self.tweens)
+
+    def add(self, item, destination, duration=MOVE_DURATION, delay=0, callback=None):
+        """item: item specifier, tag or id. callback is called after the item arrives."""
+        start = self.clock() + delay / 1000
+        self.tweens.append(Tween(item, destination, start, duration / 1000, callback))
+        if self.job is None:
+            self.job = self.canvas.after(self.interval, self.tick)
+
+    def cancel(self):
+        if self.job is not None:
+            self.canvas.after_cancel(self.job)
+        self.job = None
+        self.tweens = []
+
+    def tick(self):
+        self.job = None
+        now = self.clock()
+        running, arrived = [], []
+        for tween in self.tweens:
+            if now < tween.start:
+                running.append(tween)
+                continue
+            if tween.x is None:
+                if not (coords := self.canvas.coords(tween.item)):
+                    continue
+                tween.x, tween.y = tween.start_x, tween.start_y = coords[:2]
+            if (t := (now - tween.start) / tween.duration) >= 1:
+                x, y = tween.dest_x, tween.dest_y
+                arrived.append(tween)
+            else:
+                rate = self.easing(t)
+                x = tween.start_x + (tween.dest_x - tween.start_x) * rate
+                y = tween.start_y + (tween.dest_y - tween.start_y) * rate
+                running.append(tween)
+            self.canvas.move(tween.item, x - tween.x, y - tween.y)
+            tween.x, tween.y = x, y
+        self.tweens = running
+        for tween in arrived:
+            if tween.callback:
+                tween.callback()
+        if self.tweens and self.job is None:
+            self.job = self.canvas.after(self.interval, self.tick)
+
+
+class ItemPool:
+    """Image items of a canvas created and bound once, then reused by every
+       deal instead of deleting all of the items and creating them again.
+       A taken item is raised above the others as a new item is.
+    """
+
+    def __init__(self, canvas):
+        self.canvas = canvas
+        self.items = []
+        # the free items, the first created on the top
+        self.free = []
+        self.clicks = {}
+
+    def take(self, x, y, image, tags, click=None):
+        """Return an item placed at (x, y). click is called with the event
+           when the item is clicked until it is given back.
+        """
+        if self.free:
+            item_id = self.free.pop()
+            self.canvas.coords(item_id, x, y)
+            self.canvas.itemconfig(item_id, image=image, tags=tags, state=tk.NORMAL)
+            self.canvas.tag_raise(item_id)
+        else:
+            item_id = self.canvas.create_image(x, y, image=image, tags=tags)
+            self.canvas.tag_bind(
+                item_id, '<ButtonPress-1>',
+                lambda event, item_id=item_id: self.click(item_id, event))
+            self.items.append(item_id)
+        self.clicks[item_id] = click
+        return item_id
+
+    def click(self, item_id, event):
+        if click := self.clicks.get(item_id):
+            click(event)
+
+    def give(self, item_id):
+        """Hide the item and put it back in the pool."""
+        self.canvas.itemconfig(item_id, tags=(), state=tk.HIDDEN)
+        self.clicks[item_id] = None
+        self.free.append(item_id)
+
+    def reset(self):
+        """Put all of the items back in the pool. They are shown again when
+           taken, and the ones not taken are hidden by hide_free.
+        """
+        self.free = self.items[::-1]
+        self.clicks = {}
+
+    def hide_free(self):
+        for item_id in self.free:
+            self.canvas.itemconfig(item_id, tags=(), state=tk.HIDDEN)
+
+
+class Instruments:
+    """Count and time the canvas operations of a board and the callbacks
+       scheduled with after, keyed by the method calling them.
+       The operations are wrapped only while started, so nothing is
+       spent when the instruments are not used.
+    """
+
+    OPERATIONS = ('create_image', 'move', 'coords', 'itemconfig', 'tag_bind',
+                  'delete', 'find_closest', 'after')
+
+    clock = staticmethod(time.perf_counter)
+
+    def __init__(self, board):
+        self.board = board
+        self.clear()
+
+    def clear(self):
+        self.calls = Counter()    # (caller, operation): the number of calls
+        self.times = Counter()    # (caller, operation): seconds
+        self.stacks = Counter()   # (method, ..., operation): seconds
+        self.nested = 0
+
+    def start(self):
+        self.stop()
+        for name in self.OPERATIONS:
+            wrap = self.wrap_after if name == 'after' else self.wrap
+            setattr(self.board, name, wrap(name, getattr(self.board, name)))
+
+    def stop(self):
+        for name in self.OPERATIONS:
+            self.board.__dict__.pop(name, None)
+
+    @staticmethod
+    def stack(frame):
+        """Return the names of the functions calling the frame, the outermost first.
+           The frames of tkinter and of the instruments are left out.
+        """
+        names = []
+        while frame:
+            module = frame.f_globals.get('__name__', '')
+            # co_qualname is new in Python 3.11, so the class is taken from self.
+            instance = frame.f_locals.get('self')
+            if not module.startswith('tkinter') and not isinstance(instance, Instruments):
+                name = frame.f_code.co_name
+                if instance is not None:
+                    name = f'{Instruments.owner(type(instance), module, name).__name__}.{name}'
+                names.append(f'{module}.{name}')
+            frame = frame.f_back
+        return tuple(reversed(names))
+
+    @staticmethod
+    def owner(cls, module, name):
+        """Return the class of the module defining the method of the name,
+           which may be a base class of cls. A function nested in a method
+           is given the first class of the module, or cls if none is.
+        """
+        classes = [base for base in cls.__mro__ if base.__module__ == module]
+        default = classes[0] if classes else cls
+        return next((base for base in classes if name in base.__dict__), default)
+
+    def record(self, caller, operation, seconds):
+        self.calls[(caller, operation)] += 1
+        self.times[(caller, operation)] += seconds
+
+    def wrap(self, name, operation):
+        def timed(*args, **kwargs):
+            start = self.clock()
+            try:
+                return operation(*args, **kwargs)
+            finally:
+                seconds = self.clock() - start
+                self.nested += seconds
+                stack = self.stack(sys._getframe(1))
+                self.record(stack[-1] if stack else '', name, seconds)
+                self.stacks[stack + (name,)] += seconds
+        return timed
+
+    def wrap_after(self, name, after):
+        def timed_after(ms, func=None, *args):
+            if func is None:
+                return after(ms)
+            stack = self.stack(sys._getframe(1))
+            caller = stack[-1] if stack else ''
+            self.record(caller, name, 0)
+
+            def timed_callback(*args):
+                nested, self.nested = self.nested, 0
+                start = self.clock()
+                try:
+                    return func(*args)
+                finally:
+                    seconds = self.clock() - start
+                    self.times[(caller, name)] += seconds
+                    # the canvas operations in the callback are recorded by themselves.
+                    callback = f'{func.__module__}.{getattr(func, "__qualname__", func)}'
+                    stack = self.stack(sys._getframe(0)) + (callback,)
+                    self.stacks[stack] += seconds - self.nested
+                    self.nested = nested + seconds
+            return after(ms, timed_callback, *args)
+        return timed_after
+
+    def report(self):
+        """Return [(caller, operation, calls, seconds),...], the slowest first."""
+        rows = [(*key, self.calls[key], self.times[key]) for key in self.calls]
+        return sorted(rows, key=lambda row: row[3], reverse=True)
+
+    def dump(self, path):
+        """Write the times in microseconds as the folded stacks read by flame graph tools."""
+        with open(path, 'w') as f:
+            for stack, seconds in sorted(self.stacks.items()):
+                f.write(f'{";".join(stack)} {round(seconds * 1e6)}\n')
+
 
 class BaseBoard(tk.Canvas):
 
+    # the module of the rules engine of the game
+    engine = None
+
     def __init__(self, master, status_text, delay, sounds):
         super().__init__(
             master, width=BOARD_WIDTH, height=BOARD_HEIGHT, bg=BOARD_COLOR)
         parent_dir = pathlib.Path(__file__).parent.resolve()
         self.images_dir = parent_dir / IMAGE_ROOT
+        self.catalogue_path = parent_dir / CATALOGUE_ROOT / f'{self.__module__}.cat'
+        self.catalogue = None
+        self.save_path = parent_dir / SAVE_ROOT / f'{self.__module__}.sav'
+        self.log_dir = parent_dir / LOG_ROOT
+        self.logging = bool(os.environ.get(LOG_ENV))
+        # the log of the deal being played
+        self.log_path = None
+        self.log = None
+        self.state = None
         self.status_text = status_text
         self.delay = delay
         self.back = self.get_image(BACK)
         self.pin = self.get_image(PIN)
         self.sounds = sounds
+        self.animation = Animation(self)
+        self.pool = ItemPool(self)
+        self.history = History()
+        # the callbacks waiting to be called by after
+        self.jobs = set()
+        self.instruments = None
         self.pack(fill=tk.BOTH, expand=True)
         # self.new_game()
 
-    def new_game(self):
+    def new_game(self, deal_id=None, winnable=False, difficulty=0, cards=None):
         """
         Override this method in subclasses to
         create instance of BaseCard subclasses.
+        deal_id: the deal number to play again, or None for a new deal.
+        winnable, difficulty: deal a game solved in the catalogue
+        whose difficulty is the value or more.
+        cards: the engine cards of the deck of the deal number
+        to deal in this order instead of shuffling.
         """
         raise NotImplementedError()
 
+    def instrument(self, on=True):
+        """Start or stop the Instruments of the board, and return them."""
+        if self.instruments is None:
+            self.instruments = Instruments(self)
+        if on:
+            self.instruments.start()
+        else:
+            self.instruments.stop()
+        return self.instruments
+
+    def clear(self):
+        """Stop the moves and the callbacks of the last game, and put all
+           of the items back in the pool before a new deal.
+        """
+        self.animation.cancel()
+        self.cancel_jobs()
+        self.pool.reset()
+        self.history.clear()
+        self.close_log()
+
+    def after(self, ms, func=None, *args):
+        if func is None:
+            return super().after(ms)
+
+        def run(*args):
+            self.jobs.discard(job)
+            func(*args)
+
+        job = super().after(ms, run, *args)
+        self.jobs.add(job)
+        return job
+
+    def after_cancel(self, job):
+        self.jobs.discard(job)
+        super().after_cancel(job)
+
+    def cancel_jobs(self):
+        for job in self.jobs:
+            super().after_cancel(job)
+        self.jobs.clear()
+
+    def play(self, move):
+        """Apply the move of the engine to the state, and record it in the history."""
+        before = self.state
+        self.state = self.engine.apply(before, move)
+        self.history.record(before, move, self.state)
+        self.log_move(move)
+
+    def undo_move(self):
+        if self.history.can_undo() and not self.jobs:
+            self.show_state(self.history.undo().before)
+            if self.log:
+                self.log.undo()
+
+    def redo_move(self):
+        if self.history.can_redo() and not self.jobs:
+            step = self.history.redo()
+            self.show_state(step.after)
+            self.log_move(step.move)
+
+    def open_log(self):
+        """Start the log of the moves of the deal in a new file,
+           logs/<game>-<deal number>-<time>-<n>.log, if logging is on.
+           n makes the name unique when the deal is dealt again in the same
+           second. Only the MAX_LOGS latest logs of the game are kept.
+        """
+        self.log = None
+        if not self.logging:
+            return
+        stamp = time.strftime('%Y%m%d%H%M%S')
+        try:
+            self.log_dir.mkdir(exist_ok=True)
+            for n in itertools.count():
+                self.log_path = self.log_dir / f'{self.__module__}-{self.deal_id}-{stamp}-{n}.log'
+                try:
+                    self.log = MoveLog(self.log_path, self.engine, self.deal_id)
+                    break
+                except FileExistsError:
+                    pass
+            self.prune_logs()
+        except OSError:
+            self.log = None
+
+    def get_logs(self, deal_id='*'):
+        """Return the paths of the logs of the game, the latest first."""
+        logs = self.log_dir.glob(f'{self.__module__}-{deal_id}-*.log')
+        return sorted(logs, key=lambda path: path.stat().st_mtime, reverse=True)
+
+    def prune_logs(self):
+        for path in self.get_logs()[MAX_LOGS:]:
+            path.unlink(missing_ok=True)
+
+    def log_move(self, move):
+        if self.log:
+            self.log.append(move)
+            if self.engine.is_won(self.state):
+                self.log.won()
+                self.log = None
+
+    def close_log(self):
+        if self.log:
+            self.log.close()
+            self.log = None
+
+    def layout(self, state, previous=None):
+        """Override this method in subclasses to yield (card, (x, y, face_up))
+           of the cards in the piles of the state changed from the previous
+           state, all of the piles if None, and (card, None) of the cards
+           removed from the board. The other attributes of the board are
+           updated to the state at the same time.
+        """
+        raise NotImplementedError()
+
+    def show_state(self, state, duration=MOVE_DURATION):
+        """Put the cards where they are in the state, moving only the ones
+           in the piles changed from the state shown now, all together in
+           the duration. If the duration is 0, they are put at once.
+        """
+        previous, self.state = self.state, state
+        self.selected = []
+        self.remove_pins(*[card for card in self.playing_cards.values() if card.pin])
+        moves = []
+        for card, place in self.layout(state, previous):
+            if place is None:
+                if not card.dele:
+                    card.dele = True
+                    self.itemconfig(card.id, state=tk.HIDDEN)
+                continue
+            x, y, face_up = place
+            if card.dele:
+                card.dele = False
+                self.itemconfig(card.id, state=tk.NORMAL)
+            if card.face_up != face_up:
+                self.turn_card(card, face_up)
+            self.tag_raise(card.id)
+            if (card.x, card.y) != (x, y):
+                card.x, card.y = x, y
+                if duration:
+                    moves.append((card.id, (x, y), None))
+                else:
+                    self.coords(card.id, x, y)
+        if moves:
+            self.now_moving = True
+            self.animate_group(moves, duration, self.end_move, lockstep=True)
+
+    def end_move(self):
+        self.now_moving = False
+
+    def save(self):
+        """Save the game in progress to save_path, or remove the save of a game finished."""
+        if self.state is None:
+            return
+        if self.engine.is_won(self.state):
+            self.save_path.unlink(missing_ok=True)
+            return
+        self.save_path.parent.mkdir(exist_ok=True)
+        data = saves.dumps(self.__module__, self.deal_id, self.history.count,
+                           [face.card for face in self.deck], self.state)
+        saves.write(self.save_path, data)
+
+    def resume(self):
+        """Deal the game saved to save_path and put the cards where they were
+           at once. Return False if there is no save to resume.
+        """
+        try:
+            save = saves.read(self.save_path)
+            if save.game != self.__module__:
+                return False
+            self.new_game(save.deal_id, cards=save.cards)
+            state = saves.read_state(save, self.state)
+        except (OSError, saves.SaveError):
+            return False
+        self.show_state(state, duration=0)
+        self.history.clear(save.moves)
+        # the latest log of the deal having the moves to the saved state goes on.
+        if self.logging:
+            for path in self.get_logs(self.deal_id):
+                if log := MoveLog.resume(path, self.engine, self.deal_id, state):
+                    self.log_path, self.log = path, log
+                    break
+        return True
+
+    def get_catalogue(self):
+        """Return the Catalogue of the game, or None if it is not made."""
+        if self.catalogue is None:
+            try:
+                self.catalogue = Catalogue(self.catalogue_path)
+            except (OSError, ValueError, CatalogueError):
+                self.catalogue = False
+            else:
+                # the catalogue of another game is not used.
+                if self.catalogue.game != self.__module__:
+                    self.catalogue.close()
+                    self.catalogue = False
+        return self.catalogue or None
+
+    def shuffle(self, deal_id=None, winnable=False, difficulty=0, cards=None):
+        """Shuffle the deck, start the log of the moves and show the deal number.
+           Without the catalogue or a deal matching it, a new deal is dealt
+           and the status bar tells that no deal is catalogued.
+        """
+        uncatalogued = False
+        if cards:
+            self.deck.arrange([encode(card) for card in cards])
+            self.deal_id = deal_id
+        else:
+            if deal_id is None and (winnable or difficulty):
+                catalogue = self.get_catalogue()
+                deal_id = catalogue.sample(difficulty) if catalogue else None
+                uncatalogued = deal_id is None
+            self.deal_id = self.deck.shuffle(deal_id)
+            self.open_log()
+        text = f'{DEAL} {self.deal_id}'
+        self.status_text.set(f'{text}  {NO_CATALOGUED_DEAL}' if uncatalogued else text)
+
     def is_game_end(self):
         """Override this method in subclasses to sound a fanfare
            when winning the game.
         """
         pass
 
+    def show_hint(self):
+        """Override this method in subclasses to show a move which can be played."""
+        pass
+
     def get_image(self, file):
         image_path = self.images_dir / f'{file}.png'
         return tk.PhotoImage(file=image_path)
@@ -98,34 +665,52 @@ class BaseBoard(tk.Canvas):
         self.itemconfig(card.id, image=image)
         card.face_up = face_up
 
-    def move_card(self, item, destination):
+    def move_card(self, item, destination, callback=None, delay=0, duration=MOVE_DURATION):
         """item: item specifier, tag or id"""
-        dest_x, dest_y = destination
-        coords = self.coords(item)
-        current_x, current_y = int(coords[0]), int(coords[1])
-        offset_x = offset_y = 0
-        if current_x < dest_x:
-            offset_x = 1
-        elif current_x > dest_x:
-            offset_x = -1
-        if current_y < dest_y:
-            offset_y = 1
-        elif current_y > dest_y:
-            offset_y = -1
-        if (offset_x, offset_y) != (0, 0):
-            self.move(item, offset_x, offset_y)
-        if (current_x, current_y) == (dest_x, dest_y):
-            self.is_moved = True
+        self.animation.add(item, destination, duration, delay, callback)
+
+    def animate(self, moves, callback=None, stagger=0, duration=MOVE_DURATION):
+        """Move the items together, each one stagger milliseconds after the previous one.
+           moves: [(item, destination, callback called when the item arrives),...]
+           callback: called after all of the items arrive.
+        """
+        left = len(moves)
+
+        def arrived(on_arrival):
+            nonlocal left
+            if on_arrival:
+                on_arrival()
+            left -= 1
+            if not left and callback:
+                callback()
+
+        for i, (item, destination, on_arrival) in enumerate(moves):
+            self.move_card(item, destination, lambda f=on_arrival: arrived(f),
+                           i * stagger, duration)
+        if not moves and callback:
+            callback()
+
+    def animate_group(self, moves, total, callback=None, lockstep=False, sound=None):
+        """Move the items as a group which arrives in total milliseconds however
+           many items there are, all together in lockstep, or one after another
+           overlapping each other. The sound is played once for the group.
+        """
+        duration = min(MOVE_DURATION, total)
+        stagger = 0
+        if not lockstep and len(moves) > 1:
+            stagger = min(MOVE_STAGGER, (total - duration) / (len(moves) - 1))
+        if sound:
+            sound.play()
+        self.animate(moves, callback, stagger, duration)
 
     def set_pins(self, *cards):
         for card in cards:
-            item_id = self.create_image(
+            card.pin = self.pool.take(
                 card.x + PIN_OFFSET_X,
                 card.y - PIN_OFFSET_y,
-                image=self.pin,
-                tags=f'pin{card.id}'
+                self.pin,
+                f'pin{card.id}'
             )
-            card.pin = item_id
 
     def bad_choices(self, cards):
         self.sounds.mistake.play()
@@ -133,13 +718,14 @@ class BaseBoard(tk.Canvas):
 
     def remove_pins(self, *cards):
         for card in cards:
-            self.delete(card.pin)
+            if card.pin:
+                self.pool.give(card.pin)
             card.pin = None
 
     def delete_cards(self, *cards):
         self.sounds.disappear.play()
         for card in cards:
             card.dele = True
-            self.delete(card.id)
+            self.itemconfig(card.id, state=tk.HIDDEN)
         self.remove_pins(*cards)
         self.is_game_end()
@@ -0,0 +1,358 @@
+"""Measure the startup, dealing, judging and animation of the games.
+
+    python benchmark.py -o bench.json
+    python benchmark.py --compare baseline.json bench.json
+
+The startup is measured in new processes: importing window, decoding the
+card images and building the Window. The others are measured in this
+process on the same deal numbers every time: new_game of each board, the
+time from the click completing a move to the end of judge, and the
+frames and the time of the Klonedike stock moves. The results are
+written as JSON with the environment. --compare reports the medians
+slower than the baseline by more than --threshold and exits with 1.
+--trace writes the canvas operations of each board in the folded stacks
+of flame graph tools, measured by BaseBoard.instrument, which slows the
+boards down.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import types
+from datetime import datetime, timezone
+
+
+REPEAT = 10
+STARTUP_RUNS = 3
+THRESHOLD = 0.1
+# seconds to wait for the delayed callbacks after a move
+SETTLE = 0.3
+
+
+def summary(samples, unit='s'):
+    return {
+        'median': statistics.median(samples),
+        'mean': statistics.fmean(samples),
+        'min': min(samples),
+        'max': max(samples),
+        'runs': len(samples),
+        'unit': unit,
+    }
+
+
+def environment():
+    import tkinter as tk
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ''
+    return {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'tk': tk.TkVersion,
+        'commit': commit,
+        'time': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+    }
+
+
+def startup():
+    """Run in a new process and print the times of the startup as JSON."""
+    import importlib
+    start = time.perf_counter()
+    import tkinter as tk
+    import window
+    times = {'import': time.perf_counter() - start}
+
+    from base import Deck, FaceRegistry
+    root = tk.Tk()
+    root.withdraw()
+    start = time.perf_counter()
+    FaceRegistry.faces()
+    times['faces'] = time.perf_counter() - start
+    for module_name in window.GAME_MODULES.values():
+        module = importlib.import_module(module_name)
+        deck_class = next(obj for obj in vars(module).values()
+                          if isinstance(obj, type) and issubclass(obj, Deck) and obj is not Deck)
+        start = time.perf_counter()
+        deck_class()
+        times[f'deck.{module_name}'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    window.Window(root, audio=False)
+    root.update()
+    times['window'] = time.perf_counter() - start
+    root.destroy()
+    print(json.dumps(times))
+
+
+def bench_startup(runs):
+    samples = {}
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, os.path.abspath(__file__), '--startup'],
+                                capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+        for name, seconds in json.loads(output.splitlines()[-1]).items():
+            samples.setdefault(f'startup.{name}', []).append(seconds)
+    return {name: summary(times) for name, times in samples.items()}
+
+
+def pump(root, seconds=0.0, busy=None):
+    """Run the event loop for the seconds, and while busy returns True."""
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end or (busy and busy()):
+        root.update()
+
+
+def click(board, item_id):
+    """Call the handler bound to a canvas item as a click on it does."""
+    x, y = board.coords(item_id)[:2]
+    event = types.SimpleNamespace(x=round(x), y=round(y), widget=board)
+    holders = getattr(board, 'holders', {})
+    if any(holder.id == item_id for holder in holders.values()):
+        board.click_holder(event)
+    elif hasattr(board, 'click_card'):
+        board.click_card(event)
+    else:
+        board.click(event)
+
+
+def card_id(board, card):
+    return next(c.id for c in board.playing_cards.values() if c.card == card and not c.dele)
+
+
+def pyramid_clicks(board, engine):
+    cards = dict(engine.available(board.state))
+    for move in engine.legal_moves(board.state):
+        if move != engine.DRAW:
+            locations = sorted(move.locations, key=lambda loc: loc.pile != engine.JOCKER)
+            return [card_id(board, cards[loc]) for loc in locations]
+    return None
+
+
+def fourleafclover_clicks(board, engine):
+    for move in engine.legal_moves(board.state):
+        return [card_id(board, board.state.slots[i]) for i in move.slots]
+    return None
+
+
+def couple_clicks(board, engine):
+    for move in engine.legal_moves(board.state):
+        if move != engine.DRAW:
+            return [card_id(board, board.state.faceup[i]) for i in move.positions]
+    return None
+
+
+def klonedike_clicks(board, engine):
+    def item(pile, idx, src):
+        if pile == engine.TABLEAU:
+            column = board.state.tableau[idx]
+            if column.up:
+                return card_id(board, column.up[0] if src else column.up[-1])
+            return board.holders[f'cardholder{idx + 1}'].id
+        if pile == engine.WASTE:
+            return card_id(board, board.state.waste[-1])
+        if foundation := board.state.foundations[idx]:
+            return card_id(board, foundation[-1])
+        return board.holders[f'aceholder{idx // 2 + 1}{idx % 2 + 1}'].id
+
+    for move in engine.legal_moves(board.state):
+        if move not in (engine.DRAW, engine.RECYCLE):
+            return [item(move.src, move.src_idx, True), item(move.dst, move.dst_idx, False)]
+    return None
+
+
+CLICKS = {
+    'pyramid': pyramid_clicks,
+    'fourleafclover': fourleafclover_clicks,
+    'couple': couple_clicks,
+    'klonedike': klonedike_clicks,
+}
+
+
+class Benchmark:
+
+    def __init__(self, repeat=REPEAT, trace=None):
+        import tkinter as tk
+        import window
+        self.window_module = window
+        self.repeat = repeat
+        self.trace = trace
+        self.root = tk.Tk()
+        self.root.withdraw()
+        self.window = window.Window(self.root, audio=False)
+        pump(self.root, SETTLE)
+        if trace:
+            for _, board, _ in self.boards():
+                board.instrument()
+
+    def boards(self):
+        import importlib
+        for name, module_name in self.window_module.GAME_MODULES.items():
+            _, board = self.window.games[name]
+            yield module_name, board, importlib.import_module(f'engine.{module_name}')
+
+    def bench_new_game(self):
+        results = {}
+        for module_name, board, _ in self.boards():
+            samples = []
+            for deal_id in range(self.repeat):
+                start = time.perf_counter()
+                board.new_game(deal_id)
+                self.root.update_idletasks()
+                samples.append(time.perf_counter() - start)
+            results[f'new_game.{module_name}'] = summary(samples)
+        return results
+
+    def bench_judge(self):
+        results = {}
+        for module_name, board, engine in self.boards():
+            judged = []
+            judge = board.judge
+
+            def timed_judge(*args, judge=judge, judged=judged):
+                result = judge(*args)
+                judged.append(time.perf_counter())
+                return result
+
+            board.judge, delay, board.delay = timed_judge, board.delay, 0
+            samples = []
+            deal_id = 0
+            while len(samples) < self.repeat and deal_id < self.repeat * 10:
+                board.new_game(deal_id)
+                deal_id += 1
+                if not (clicks := CLICKS[module_name](board, engine)):
+                    continue
+                for item_id in clicks[:-1]:
+                    click(board, item_id)
+                    pump(self.root, busy=lambda: board.now_moving)
+                count = len(judged)
+                start = time.perf_counter()
+                click(board, clicks[-1])
+                pump(self.root, busy=lambda: len(judged) == count)
+                samples.append(judged[-1] - start)
+                pump(self.root, SETTLE, busy=lambda: board.now_moving)
+            del board.judge
+            board.delay = delay
+            if samples:
+                results[f'judge.{module_name}'] = summary(samples)
+        return results
+
+    def bench_klonedike_stock(self):
+        from engine import klonedike as engine
+        _, board = self.window.games[self.window_module.KLONEDIKE]
+        frames = []
+        tick = board.animation.tick
+
+        def counted_tick():
+            frames.append(time.perf_counter())
+            tick()
+
+        board.animation.tick = counted_tick
+        draws, recycles, draw_frames, recycle_frames = [], [], [], []
+        for deal_id in range(self.repeat):
+            board.new_game(deal_id)
+            while board.state.stock:
+                del frames[:]
+                start = time.perf_counter()
+                click(board, card_id(board, board.state.stock[-1]))
+                pump(self.root, busy=lambda: board.now_moving)
+                draws.append(time.perf_counter() - start)
+                draw_frames.append(len(frames))
+            del frames[:]
+            start = time.perf_counter()
+            board.start_stock_back(None)
+            pump(self.root, busy=lambda: board.now_moving)
+            recycles.append(time.perf_counter() - start)
+            recycle_frames.append(len(frames))
+            assert board.state.stock and not board.state.waste, engine.RECYCLE
+        del board.animation.tick
+        return {
+            'move.klonedike.draw': summary(draws),
+            'frames.klonedike.draw': summary(draw_frames, 'frames'),
+            'move.klonedike.stock_back': summary(recycles),
+            'frames.klonedike.stock_back': summary(recycle_frames, 'frames'),
+        }
+
+    def dump(self):
+        os.makedirs(self.trace, exist_ok=True)
+        for module_name, board, _ in self.boards():
+            board.instrument(False).dump(os.path.join(self.trace, f'{module_name}.folded'))
+
+    def close(self):
+        if self.trace:
+            self.dump()
+        self.root.destroy()
+
+
+def run(repeat=REPEAT, startup_runs=STARTUP_RUNS, trace=None):
+    results = bench_startup(startup_runs)
+    bench = Benchmark(repeat, trace)
+    try:
+        results.update(bench.bench_new_game())
+        results.update(bench.bench_judge())
+        results.update(bench.bench_klonedike_stock())
+    finally:
+        bench.close()
+    return {'environment': environment(), 'results': results}
+
+
+def compare(baseline, current, threshold=THRESHOLD):
+    """Print the medians of both, and return the names of the regressions."""
+    regressions = []
+    for name, result in sorted(current['results'].items()):
+        if (base := baseline['results'].get(name)) is None:
+            print(f'{name:32} {result["median"]:12.6f} (new)')
+            continue
+        ratio = result['median'] / base['median'] if base['median'] else 1.0
+        regressed = ratio > 1 + threshold
+        if regressed:
+            regressions.append(name)
+        print(f'{name:32} {base["median"]:12.6f} {result["median"]:12.6f} {ratio:7.2f}x'
+              f'{"  REGRESSION" if regressed else ""}')
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-o', '--output', help='the JSON file of the results')
+    parser.add_argument('-r', '--repeat', type=int, default=REPEAT)
+    parser.add_argument('--startup-runs', type=int, default=STARTUP_RUNS)
+    parser.add_argument('--compare', nargs='+', metavar=('BASELINE', 'RESULTS'),
+                        help='compare the results, or a new run, with the baseline')
+    parser.add_argument('--threshold', type=float, default=THRESHOLD)
+    parser.add_argument('--trace', metavar='DIR', help='write <game>.folded to the directory')
+    parser.add_argument('--startup', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.startup:
+        return startup()
+    if args.compare and len(args.compare) > 1:
+        with open(args.compare[1]) as f:
+            current = json.load(f)
+    else:
+        current = run(args.repeat, args.startup_runs, args.trace)
+        text = json.dumps(current, indent=2)
+        if args.output:
+            with open(args.output, 'w') as f:
+                f.write(text + '\n')
+        elif not args.compare:
+            print(text)
+    if args.compare:
+        with open(args.compare[0]) as f:
+            baseline = json.load(f)
+        if regressions := compare(baseline, current, args.threshold):
+            print(f'{len(regressions)} regressions')
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
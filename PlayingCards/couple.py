@@ -1,8 +1,9 @@
 import tkinter as tk
 from collections import namedtuple
 
-from base import BaseBoard, BaseCard, CardFace, Deck
-from Globals import BOARD_WIDTH, BOARD_HEIGHT, CARD_ROOT, MOVE_SPEED
+from base import BaseBoard, BaseCard, Deck, common_length
+from engine import couple as engine
+from Globals import BOARD_WIDTH, BOARD_HEIGHT, CARD_ROOT, MOVE_STAGGER
 
 
 CARD_X = int(BOARD_WIDTH / 2) - 150
@@ -13,6 +14,9 @@ SPACE = 90
 STOCK_X = BOARD_WIDTH - 150
 STOCK_Y = BOARD_HEIGHT - 100
 SCROLL_REGION = 2000
+# the tag of all of the stock cards, to move them together
+STOCK = 'stock'
+NO_MOVES = 'No more pairs can be removed.'
 
 
 MoveCard = namedtuple('MoveCard', ['card', 'dest_x', 'dest_y'])
@@ -20,16 +24,10 @@ MoveCard = namedtuple('MoveCard', ['card', 'dest_x', 'dest_y'])
 
 class CoupleDeck(Deck):
 
-    def __init__(self):
-        super().__init__()
-        self._deck = [card for card in self.get_cards()]
-
     def get_cards(self):
-        for path in self.cards_dir.iterdir():
-            name = path.stem
-            mark, value = name.split('_')
-            if not mark.startswith('jocker'):
-                yield CardFace(tk.PhotoImage(file=path), mark, int(value))
+        for face in super().get_cards():
+            if not face.mark.startswith('jocker'):
+                yield face
 
 
 class CardOnBoard(BaseCard):
@@ -43,6 +41,8 @@ class CardOnBoard(BaseCard):
 
 class Board(BaseBoard):
 
+    engine = engine
+
     def __init__(self, master, status_text, sounds, delay=400):
         super().__init__(master, status_text, delay, sounds)
         self.row_position = 0
@@ -50,19 +50,27 @@ class Board(BaseBoard):
         self.selected = []
         self.now_moving = False
         self.ybar = None
-        self.ybar_pos = 0.0
+        self.scroll_last = None
+        self.scroll_job = None
+        self.stock_y = STOCK_Y
         self.deck = CoupleDeck()
 
-    def new_game(self):
-        self.delete('all')
+    def new_game(self, deal_id=None, winnable=False, difficulty=0, cards=None):
+        self.clear()
+        self.now_moving = False
         # config() changes attributes after creating object.
         self.config(width=BOARD_WIDTH, height=BOARD_HEIGHT)
-        self.deck.shuffle()
+        self.shuffle(deal_id, winnable, difficulty, cards)
         self.playing_cards = {}
-        self.setup_cards(self.deck[:12])
-        self.set_stock_cards(self.deck[12:])
-        for name in self.playing_cards.keys():
-            self.tag_bind(name, '<ButtonPress-1>', self.click)
+        self.state = engine.deal([face.card for face in self.deck])
+        self.finder = engine.PairFinder(self.state)
+        self.setup_cards(self.deck[:engine.FIRST_DEAL])
+        self.stock_y = STOCK_Y
+        # clear() has cancelled the job following the scroll of the last game.
+        self.scroll_job = None
+        self.set_stock_cards(self.deck[engine.FIRST_DEAL:])
+        self.cards = {card.card: card for card in self.playing_cards.values()}
+        self.pool.hide_free()
         self.faceup_cards = [card for name, card in self.playing_cards.items() if name.startswith('card')]
         self.create_scrollbar()
 
@@ -76,12 +84,18 @@ class Board(BaseBoard):
         self.yview_moveto(0)
 
     def handle_scroll(self, first, last):
+        """Keep the stock at the bottom of the view. The scroll comes
+           faster than the frames, so the stock follows it once a frame.
+        """
         self.ybar.set(first, last)
-        first = float(first)
-        if first != self.ybar_pos:
-            # the last of the scrollbar means the positin in the scrollregion
-            self.rearange_stock_cards(float(last) * SCROLL_REGION - 100)
-            self.ybar_pos = first
+        self.scroll_last = float(last)
+        if self.scroll_job is None:
+            self.scroll_job = self.after(self.animation.interval, self.follow_scroll)
+
+    def follow_scroll(self):
+        self.scroll_job = None
+        # the last of the scrollbar means the positin in the scrollregion
+        self.rearange_stock_cards(self.scroll_last * SCROLL_REGION - 100)
 
     def get_tag(self, event):
         ybar_pos, _ = self.ybar.get()
@@ -98,8 +112,8 @@ class Board(BaseBoard):
             else:
                 self.col_position += SPACE
             name = f'card{i}'
-            item_id = self.create_image(
-                self.col_position, self.row_position, image=face.image, tags=name)
+            item_id = self.pool.take(
+                self.col_position, self.row_position, face.image, name, self.click)
             card = CardOnBoard(item_id, face, self.col_position, self.row_position, True, i)
             self.playing_cards[name] = card
 
@@ -107,7 +121,7 @@ class Board(BaseBoard):
         x, y = STOCK_X, STOCK_Y
         for i, face in enumerate(cards):
             name = f'stock{i}'
-            item_id = self.create_image(x, y, image=self.back, tags=name)
+            item_id = self.pool.take(x, y, self.back, (name, STOCK), self.click)
             card = CardOnBoard(item_id, face, x, y, order=i)
             self.playing_cards[name] = card
             x += STACK_OFFSET
@@ -126,22 +140,23 @@ class Board(BaseBoard):
                     self.remove_pins(card)
                     self.selected.remove(card)
             else:
-                self.move_stock_card(card)
+                self.move_stock_card()
 
     def judge(self):
         card1, card2 = self.selected
         self.update_status()
         same_value = False
-        if len(set(card.value for card in self.selected)) == 1:
-            if card2.order in {card1.order - 4, card1.order + 4, card1.order - 1, card1.order + 1,
-                               card1.order - 5, card1.order + 5, card1.order - 3, card1.order + 3}:
-                same_value = True
-                self.faceup_cards = [card for card in self.faceup_cards if card not in self.selected]
-                remove_cards = self.selected[0:]
-                self.after(self.delay, lambda: self.remove_pins(*remove_cards))
-                self.after(self.delay, lambda: self.delete_cards(*remove_cards))
-                if move_cards := [card for card in self.rearange_cards()]:
-                    self.after(self.delay + 200, lambda: self.start_move(*move_cards))
+        move = engine.Move(engine.REMOVE, (card1.order, card2.order))
+        if engine.is_legal(self.state, move):
+            self.play(move)
+            self.finder.update(self.state, move)
+            same_value = True
+            self.faceup_cards = [card for card in self.faceup_cards if card not in self.selected]
+            remove_cards = self.selected[0:]
+            self.after(self.delay, lambda: self.remove_pins(*remove_cards))
+            self.after(self.delay, lambda: self.delete_cards(*remove_cards))
+            if move_cards := [card for card in self.rearange_cards()]:
+                self.after(self.delay + 200, lambda: self.start_move(*move_cards))
         if not same_value:
             self.sounds.mistake.play()
             remove_cards = self.selected[0:]
@@ -149,15 +164,12 @@ class Board(BaseBoard):
         self.selected = []
 
     def rearange_stock_cards(self, y):
-        stocks = [card for card in self.playing_cards.values() if not card.face_up]
-        stocks.sort(key=lambda x: x.order)
-        x = STOCK_X
-        for stock in stocks:
-            self.coords(stock.id, x, y)
-            stock.y = y
-            stock.x = x
-            x += STACK_OFFSET
-            y -= STACK_OFFSET
+        """Move the stock cards to the y by their tag in one canvas call."""
+        if dy := y - self.stock_y:
+            self.move(STOCK, 0, dy)
+            self.stock_y = y
+            for card in self.state.stock:
+                self.cards[card].y += dy
 
     def rearange_cards(self):
         self.col_position, self.row_position = 0, 0
@@ -171,7 +183,12 @@ class Board(BaseBoard):
                 card.order = i
                 yield MoveCard(card, self.col_position, self.row_position)
 
-    def move_stock_card(self, card):
+    def move_stock_card(self):
+        # the top card is drawn wherever the stock is clicked, as the engine does.
+        card = self.cards[self.state.stock[-1]]
+        self.dtag(card.id, STOCK)
+        self.play(engine.DRAW)
+        self.finder.update(self.state, engine.DRAW)
         self.faceup_cards.append(card)
         self.idx = len(self.faceup_cards) - 1
         card.order = self.idx
@@ -182,41 +199,68 @@ class Board(BaseBoard):
             self.col_position += SPACE
         move_card = MoveCard(card, self.col_position, self.row_position)
         self.after(self.delay, lambda: self.start_move(move_card))
+        self.is_game_end()
 
     def start_move(self, *cards):
-        self.move_items = cards
-        self.idx = 0
-        self.is_moved = False
-        self.now_moving = True
-        self.run_move_sequence()
-
-    def run_move_sequence(self):
-        if not self.is_moved:
-            item = self.move_items[self.idx]
+        moves = []
+        for item in cards:
             if not item.card.face_up:
                 self.turn_card(item.card, True)
                 self.tag_raise(item.card.id)
-            self.move_card(item.card.id, (item.dest_x, item.dest_y))
-            self.after(MOVE_SPEED, self.run_move_sequence)
+            moves.append((item.card.id, (item.dest_x, item.dest_y),
+                          lambda item=item: self.after_move(item)))
+        self.now_moving = True
+        self.animate(moves, self.end_move, MOVE_STAGGER)
+
+    def after_move(self, item):
+        item.card.x = item.dest_x
+        item.card.y = item.dest_y
+        self.sounds.lineup.play()
+
+    def layout(self, state, previous=None):
+        start = common_length(state.faceup, previous.faceup) if previous else 0
+        for i in range(start, len(state.faceup)):
+            card = self.cards[state.faceup[i]]
+            card.order = i
+            self.dtag(card.id, STOCK)
+            yield card, (CARD_X + i % engine.COLUMNS * SPACE, (i // engine.COLUMNS + 1) * CARD_OFFSET_Y, True)
+        stock_start = common_length(state.stock, previous.stock) if previous else 0
+        for i in range(stock_start, len(state.stock)):
+            card = self.cards[state.stock[i]]
+            card.order = i
+            self.addtag_withtag(STOCK, card.id)
+            yield card, (STOCK_X + i * STACK_OFFSET, self.stock_y - i * STACK_OFFSET, False)
+        if previous:
+            left = set(state.faceup[start:]).union(state.stock[stock_start:])
+            for card in previous.faceup[start:] + previous.stock[stock_start:]:
+                if card not in left:
+                    yield self.cards[card], None
+        self.faceup_cards = [self.cards[card] for card in state.faceup]
+        self.finder = engine.PairFinder(state)
+        # the position of the last face-up card, next to which a stock card is put
+        if state.faceup:
+            last = len(state.faceup) - 1
+            self.col_position = CARD_X + last % engine.COLUMNS * SPACE
+            self.row_position = (last // engine.COLUMNS + 1) * CARD_OFFSET_Y
         else:
-            item = self.move_items[self.idx]
-            item.card.x = item.dest_x
-            item.card.y = item.dest_y
-            self.idx += 1
-            self.sounds.lineup.play()
-            if self.idx < len(self.move_items):
-                self.is_moved = False
-                self.run_move_sequence()
-            else:
-                self.now_moving = False
+            self.col_position, self.row_position = 0, 0
 
     def update_status(self):
         text = ', '.join([f'{card.mark} {card.value}' for card in self.selected])
         self.status_text.set(text)
 
+    def show_hint(self):
+        if not self.now_moving and (moves := self.finder.moves()):
+            if moves[0] == engine.DRAW:
+                return
+            cards = [self.state.faceup[i] for i in moves[0].positions]
+            self.status_text.set(', '.join([f'{card.mark} {card.value}' for card in cards]))
+
     def is_game_end(self):
-        if not [card for card in self.playing_cards.values() if not card.dele]:
+        if engine.is_won(self.state):
             self.sounds.fanfare.play()
+        elif not self.finder.has_moves():
+            self.status_text.set(NO_MOVES)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,6 @@
+"""Rules of the games without any user interface.
+   Nothing in this package may import tkinter or pygame.
+"""
+
+# the modules of the games in this package
+GAMES = ('pyramid', 'fourleafclover', 'klonedike', 'couple')
@@ -0,0 +1,38 @@
+from collections import namedtuple
+
+
+MARKS = ('club', 'diamond', 'heart', 'spade')
+RED_MARKS = {'diamond', 'heart'}
+JOCKERS = ('jocker1', 'jocker2', 'jocker3', 'jocker4')
+ACE = 1
+KING = 13
+JOCKER_VALUE = 14
+RANKS = KING - ACE + 1
+
+
+Card = namedtuple('Card', 'mark value')
+
+
+def standard_deck():
+    """Return the 52 cards without jockers in the order of FaceRegistry."""
+    return [Card(mark, value) for mark in MARKS for value in range(ACE, KING + 1)]
+
+
+def encode(card):
+    """Return the code of a card without jockers, 0 to 51 in the order of
+       standard_deck: the index of the mark * 13 + the value - 1.
+    """
+    return MARKS.index(card.mark) * RANKS + card.value - ACE
+
+
+def decode(code):
+    mark, rank = divmod(code, RANKS)
+    return Card(MARKS[mark], rank + ACE)
+
+
+def jockers():
+    return [Card(mark, JOCKER_VALUE) for mark in JOCKERS]
+
+
+def is_red(card):
+    return card.mark in RED_MARKS
@@ -0,0 +1,133 @@
+"""A binary catalogue of solved deals, read through mmap.
+
+The file of a game holds, after the header:
+    at_least: 256 u64, the number of the solved deals whose difficulty
+              is the index or more.
+    records:  one Record of 4 bytes per deal number from start.
+    solved:   u32 of the deal numbers - start of the solved deals,
+              the most difficult first.
+so a solved deal of a difficulty or more is sampled in O(1) without
+reading the whole file.
+"""
+import math
+import mmap
+import os
+import random
+import struct
+from collections import namedtuple
+
+
+MAGIC = b'PCAT'
+VERSION = 1
+HEADER = struct.Struct('<4sB15sQQQ')
+AT_LEAST = struct.Struct('<256Q')
+RECORD = struct.Struct('<BBH')
+INDEX = struct.Struct('<I')
+MAX_DIFFICULTY = 255
+# status
+UNKNOWN = 0
+SOLVED = 1
+UNSOLVABLE = 2
+
+
+# difficulty: 0 to 255, moves: the length of the solution.
+Record = namedtuple('Record', 'status difficulty moves')
+
+
+class CatalogueError(Exception):
+    pass
+
+
+def difficulty(nodes):
+    """Return the difficulty of a deal from the number of the positions searched."""
+    return min(MAX_DIFFICULTY, round(math.log2(nodes + 1) * 8))
+
+
+def write(path, game, start, records):
+    """records: the Records of the deal numbers from start in order.
+       The file is written to a temporary file which then replaces it,
+       so that the boards never read a catalogue half written.
+    """
+    solved = []
+    at_least = [0] * (MAX_DIFFICULTY + 1)
+    temp = f'{path}.tmp'
+    with open(temp, 'wb') as f:
+        f.seek(HEADER.size + AT_LEAST.size)
+        count = 0
+        for i, record in enumerate(records):
+            f.write(RECORD.pack(*record))
+            if record.status == SOLVED:
+                solved.append((record.difficulty, i))
+                at_least[record.difficulty] += 1
+            count += 1
+        solved.sort(reverse=True)
+        for _, i in solved:
+            f.write(INDEX.pack(i))
+        for d in range(MAX_DIFFICULTY - 1, -1, -1):
+            at_least[d] += at_least[d + 1]
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, VERSION, game.encode(), start, count, len(solved)))
+        f.write(AT_LEAST.pack(*at_least))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp, path)
+
+
+class Catalogue:
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            try:
+                self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise CatalogueError(f'{path} is empty.') from None
+        try:
+            self.read_header(path)
+        except CatalogueError:
+            self.map.close()
+            raise
+
+    def read_header(self, path):
+        try:
+            magic, version, game, self.start, self.count, self.solved = \
+                HEADER.unpack_from(self.map)
+            self.at_least = AT_LEAST.unpack_from(self.map, HEADER.size)
+        except struct.error:
+            raise CatalogueError(f'{path} is truncated.') from None
+        if magic != MAGIC or version != VERSION:
+            raise CatalogueError(f'{path} is not a catalogue of version {VERSION}.')
+        try:
+            self.game = game.rstrip(b'\0').decode()
+        except UnicodeDecodeError:
+            raise CatalogueError(f'The game of {path} is broken.') from None
+        self.records_offset = HEADER.size + AT_LEAST.size
+        self.index_offset = self.records_offset + self.count * RECORD.size
+        # sample reads the index by at_least, so both must fit in the file.
+        if len(self.map) < self.index_offset + self.solved * INDEX.size:
+            raise CatalogueError(f'{path} is truncated.')
+        if max(self.at_least) > self.solved:
+            raise CatalogueError(f'{path} has more solved deals than its index.')
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, deal_id):
+        return self.start <= deal_id < self.start + self.count
+
+    def record(self, deal_id):
+        if deal_id not in self:
+            raise KeyError(deal_id)
+        offset = self.records_offset + (deal_id - self.start) * RECORD.size
+        return Record(*RECORD.unpack_from(self.map, offset))
+
+    def sample(self, min_difficulty=0, rng=random):
+        """Return the number of a solved deal of the difficulty or more at random,
+           or None if there is no such deal.
+        """
+        if not (n := self.at_least[max(0, min(min_difficulty, MAX_DIFFICULTY))]):
+            return None
+        k = rng.randrange(n)
+        return self.start + INDEX.unpack_from(self.map, self.index_offset + k * INDEX.size)[0]
+
+    def close(self):
+        self.map.close()
@@ -0,0 +1,129 @@
+from collections import namedtuple
+
+from engine.cards import standard_deck
+
+
+COLUMNS = 4
+FIRST_DEAL = 12
+REMOVE = 'remove'
+
+
+# faceup: the face-up cards in the order of the layout.
+# stock: the face-down cards, the last card is on top.
+State = namedtuple('State', 'faceup stock')
+Move = namedtuple('Move', 'kind positions')
+
+DRAW = Move('draw', ())
+DECK = standard_deck()
+
+
+def neighbour_tables(size=len(DECK), columns=COLUMNS):
+    """Return the positions around each position of the layout,
+       and the ones of them after the position.
+    """
+    neighbours, forward = [], []
+    for i in range(size):
+        row, col = divmod(i, columns)
+        cells = [r * columns + c for r in (row - 1, row, row + 1) for c in (col - 1, col, col + 1)
+                 if 0 <= r and 0 <= c < columns and (r, c) != (row, col)]
+        neighbours.append(frozenset(cells))
+        forward.append(tuple(cell for cell in cells if cell > i))
+    return tuple(neighbours), tuple(forward)
+
+
+NEIGHBOURS, FORWARD = neighbour_tables()
+
+
+def deal(cards, size=FIRST_DEAL):
+    return State(tuple(cards[:size]), tuple(cards[size:]))
+
+
+def is_adjacent(pos1, pos2):
+    return pos2 in NEIGHBOURS[pos1]
+
+
+class PairFinder:
+    """Keep the adjacent pairs of the same value in the layout.
+       Removing cards closes up only the layout after them, so only the
+       pairs around and after the first removed position are found again.
+    """
+
+    def __init__(self, state):
+        self.faceup = []
+        # value => the positions of the cards with the value
+        self.positions = {}
+        self.pairs = set()
+        self.stock = state.stock
+        self.rebuild(state, 0)
+
+    def update(self, state, move):
+        """state: the state after the move."""
+        start = len(self.faceup) if move == DRAW else min(move.positions)
+        self.stock = state.stock
+        self.rebuild(state, start)
+
+    def rebuild(self, state, start):
+        for i in range(start, len(self.faceup)):
+            self.positions[self.faceup[i].value].discard(i)
+        self.faceup = list(state.faceup)
+        for i in range(start, len(self.faceup)):
+            self.positions.setdefault(self.faceup[i].value, set()).add(i)
+        self.pairs = {pair for pair in self.pairs if pair[1] < start}
+        size = len(self.faceup)
+        for i in range(max(0, start - COLUMNS - 1), size):
+            same = self.positions[self.faceup[i].value]
+            for j in FORWARD[i]:
+                if j >= start and j < size and j in same:
+                    self.pairs.add((i, j))
+
+    def moves(self):
+        moves = [Move(REMOVE, pair) for pair in sorted(self.pairs)]
+        if self.stock:
+            moves.append(DRAW)
+        return moves
+
+    def has_moves(self):
+        return bool(self.pairs or self.stock)
+
+
+def legal_moves(state):
+    return iter(PairFinder(state).moves())
+
+
+def is_legal(state, move):
+    if move == DRAW:
+        return bool(state.stock)
+    i, j = move.positions
+    size = len(state.faceup)
+    return 0 <= i < size and 0 <= j < size and is_adjacent(i, j) \
+        and state.faceup[i].value == state.faceup[j].value
+
+
+def apply(state, move):
+    """Return the state after the move. The remaining cards
+       are closed up without changing their order.
+    """
+    if move == DRAW:
+        return State(state.faceup + state.stock[-1:], state.stock[:-1])
+    faceup = tuple(card for i, card in enumerate(state.faceup) if i not in move.positions)
+    return State(faceup, state.stock)
+
+
+def is_won(state):
+    return not state.faceup and not state.stock
+
+
+def encode_move(move):
+    """Return the code of a move, 0 for DRAW, or 1 + the positions of
+       the pair as the digits in base of the size of the deck.
+    """
+    if move == DRAW:
+        return 0
+    i, j = move.positions
+    return 1 + i * len(DECK) + j
+
+
+def decode_move(code):
+    if not code:
+        return DRAW
+    return Move(REMOVE, divmod(code - 1, len(DECK)))
@@ -0,0 +1,77 @@
+"""Deal many games at once as arrays of card codes.
+
+A deal is a row of the codes of engine.cards.encode in the order of the
+shuffled deck, so the cards of a game are decode(code) of each code.
+The rows are shuffled by SplitMix64 and the Fisher-Yates shuffle of
+engine.seeds, one step for all of the rows at a time, so a row is the
+same deal as the one of its deal number on the status bar.
+Unlike the rest of the engine, this module needs NumPy.
+"""
+import numpy as np
+
+from engine.cards import ACE, MARKS, RANKS, decode, encode, standard_deck
+from engine.seeds import GAMMA, MASK
+
+
+CARDS = tuple(decode(code) for code in range(len(MARKS) * RANKS))
+
+
+def deck_codes(deck=None):
+    """Return the codes of the cards of a deck, the standard deck by default."""
+    deck = standard_deck() if deck is None else deck
+    return np.fromiter((encode(card) for card in deck), dtype=np.uint8, count=len(deck))
+
+
+def mix(states):
+    """Return SplitMix64.next of the states, already advanced by GAMMA.
+       uint64 arithmetic wraps around as the masks do.
+    """
+    z = (states ^ (states >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+
+def deal_codes(deal_ids, deck=None):
+    """Return the uint8 array of shape (the number of deal numbers, the
+       number of cards) whose rows are the codes of the deck shuffled as
+       seeds.shuffle does from each deal number.
+    """
+    ids = np.fromiter((deal_id & MASK for deal_id in deal_ids), dtype=np.uint64)
+    deals = np.tile(deck_codes(deck), (len(ids), 1))
+    rows = np.arange(len(ids))
+    states = ids
+    gamma = np.uint64(GAMMA)
+    with np.errstate(over='ignore'):
+        for i in range(deals.shape[1] - 1, 0, -1):
+            n = i + 1
+            states = states + gamma
+            values = mix(states)
+            # SplitMix64.below draws again above the limit, which is very rare,
+            # and never if n is a power of 2.
+            if (bias := (MASK + 1) % n):
+                limit = np.uint64(MASK + 1 - bias)
+                while (rejected := values >= limit).any():
+                    states[rejected] += gamma
+                    values[rejected] = mix(states[rejected])
+            j = (values % np.uint64(n)).astype(np.intp)
+            deals[rows, i], deals[rows, j] = deals[rows, j], deals[rows, i].copy()
+    return deals
+
+
+def marks(codes):
+    """Return the indexes of MARKS of the codes."""
+    return codes // RANKS
+
+
+def values(codes):
+    return codes % RANKS + ACE
+
+
+def to_cards(codes):
+    """Return the list of the cards of a deal."""
+    return [CARDS[code] for code in codes.tolist()]
+
+
+def deal_states(engine, deal_ids):
+    """Return the first states of the game of the engine from the deal numbers."""
+    return [engine.deal(to_cards(codes)) for codes in deal_codes(deal_ids, engine.DECK)]
@@ -0,0 +1,140 @@
+from collections import namedtuple
+
+from engine.cards import MARKS, standard_deck
+
+
+ROWS = 4
+COLUMNS = 4
+SIZE = ROWS * COLUMNS
+TOTAL = 15
+COURT_CARDS = 3
+INVALID = 'invalid'
+PENDING = 'pending'
+VALID = 'valid'
+
+
+# slots: the face-up cards, None if no card is left for the slot.
+# stock: the face-down cards, the last card is on top.
+State = namedtuple('State', 'slots stock')
+Move = namedtuple('Move', 'slots')
+
+DECK = [card for card in standard_deck() if card.value != 10]
+
+
+def deal(cards, size=SIZE):
+    return State(tuple(cards[:size]), tuple(cards[size:]))
+
+
+def is_court(card):
+    return card.value > 10
+
+
+def judge(cards):
+    """Return VALID if the cards can be removed, PENDING if more cards
+       can be added to them, or INVALID.
+    """
+    if len(set(card.mark for card in cards)) > 1:
+        return INVALID
+    court_cards = sum(is_court(card) for card in cards)
+    number_cards = len(cards) - court_cards
+    if court_cards and number_cards:
+        return INVALID
+    if court_cards:
+        return VALID if court_cards == COURT_CARDS else PENDING
+    total = sum(card.value for card in cards)
+    if total > TOTAL:
+        return INVALID
+    return VALID if total == TOTAL and number_cards >= 2 else PENDING
+
+
+def subsets(cards, total, start=0):
+    """Yield the index tuples of the (slot, card) pairs whose values make the total."""
+    for i in range(start, len(cards)):
+        _, card = cards[i]
+        if card.value == total:
+            yield (i,)
+        elif card.value < total:
+            for rest in subsets(cards, total - card.value, i + 1):
+                yield (i,) + rest
+
+
+def mark_moves(cards):
+    """cards: [(slot, card),...] of a mark. Return the moves removing them."""
+    moves = []
+    if len(court := [i for i, card in cards if is_court(card)]) == COURT_CARDS:
+        moves.append(Move(tuple(court)))
+    numbers = [(i, card) for i, card in cards if not is_court(card)]
+    for selected in subsets(numbers, TOTAL):
+        if len(selected) >= 2:
+            moves.append(Move(tuple(sorted(numbers[j][0] for j in selected))))
+    return moves
+
+
+class MoveFinder:
+    """Keep the face-up cards bucketed by mark with the moves of each mark.
+       After a move only the marks of the replaced cards are searched again.
+    """
+
+    def __init__(self, state):
+        self.slots = list(state.slots)
+        self.buckets = {mark: {} for mark in MARKS}
+        self.cache = {}
+        for i, card in enumerate(self.slots):
+            if card:
+                self.buckets[card.mark][i] = card
+
+    def update(self, state, move):
+        """state: the state after the move."""
+        for i in move.slots:
+            if old := self.slots[i]:
+                del self.buckets[old.mark][i]
+                self.cache.pop(old.mark, None)
+            if new := state.slots[i]:
+                self.buckets[new.mark][i] = new
+                self.cache.pop(new.mark, None)
+            self.slots[i] = new
+
+    def mark_moves(self, mark):
+        if mark not in self.cache:
+            self.cache[mark] = mark_moves(sorted(self.buckets[mark].items()))
+        return self.cache[mark]
+
+    def moves(self):
+        return [move for mark in MARKS for move in self.mark_moves(mark)]
+
+    def has_moves(self):
+        return any(self.mark_moves(mark) for mark in MARKS)
+
+
+def legal_moves(state):
+    return iter(MoveFinder(state).moves())
+
+
+def is_legal(state, move):
+    cards = [state.slots[i] for i in move.slots]
+    return len(set(move.slots)) == len(move.slots) and None not in cards \
+        and judge(cards) == VALID
+
+
+def apply(state, move):
+    """Return the state after the move. The top of the stock fills
+       the emptied slot with the smallest index first.
+    """
+    slots = list(state.slots)
+    stock = list(state.stock)
+    for i in sorted(move.slots):
+        slots[i] = stock.pop() if stock else None
+    return State(tuple(slots), tuple(stock))
+
+
+def is_won(state):
+    return not state.stock and not any(state.slots)
+
+
+def encode_move(move):
+    """Return the code of a move, the bitmask of the slots."""
+    return sum(1 << i for i in move.slots)
+
+
+def decode_move(code):
+    return Move(tuple(i for i in range(SIZE) if code >> i & 1))
@@ -0,0 +1,58 @@
+"""The moves played, to undo and redo them.
+
+The states of the engines are tuples which are never changed: apply
+builds only the piles changed by a move and shares the others with the
+state before it. So a Step keeps both of the states at the cost of the
+changed piles, and undo and redo just return one of them.
+"""
+from collections import namedtuple
+
+
+Step = namedtuple('Step', 'before move after')
+
+
+class History:
+
+    def __init__(self, start=0):
+        self.start = start
+        self.done = []
+        self.undone = []
+
+    def __len__(self):
+        return len(self.done)
+
+    @property
+    def count(self):
+        """The number of the moves played, including the ones before start."""
+        return self.start + len(self.done)
+
+    def record(self, before, move, after):
+        self.done.append(Step(before, move, after))
+        self.undone.clear()
+
+    def can_undo(self):
+        return bool(self.done)
+
+    def can_redo(self):
+        return bool(self.undone)
+
+    def undo(self):
+        """Return the Step of the last move, whose before is the state to go back to."""
+        step = self.done.pop()
+        self.undone.append(step)
+        return step
+
+    def redo(self):
+        """Return the Step of the last undone move, whose after is the state to go to."""
+        step = self.undone.pop()
+        self.done.append(step)
+        return step
+
+    def moves(self):
+        return [step.move for step in self.done]
+
+    def clear(self, start=0):
+        """start: the number of the moves played before, which cannot be undone."""
+        self.start = start
+        self.done.clear()
+        self.undone.clear()
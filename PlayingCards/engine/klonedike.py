@@ -0,0 +1,272 @@
+from collections import namedtuple
+
+from engine.cards import ACE, KING, is_red, standard_deck
+
+
+ROWS = 7
+FOUNDATIONS = 4
+TABLEAU = 'tableau'
+FOUNDATION = 'foundation'
+WASTE = 'waste'
+STOCK = 'stock'
+
+
+# down: face-down cards, up: face-up cards. The last card is on top.
+Column = namedtuple('Column', 'down up')
+State = namedtuple('State', 'tableau foundations stock waste')
+Move = namedtuple('Move', 'src src_idx dst dst_idx')
+
+DRAW = Move(STOCK, 0, WASTE, 0)
+RECYCLE = Move(WASTE, 0, STOCK, 0)
+DECK = standard_deck()
+
+
+def deal(cards, rows=ROWS):
+    """cards: the shuffled deck. The first cards are dealt to the tableau
+       as [[1 card], [2 cards], [3 cards],...] and the rest become the stock.
+    """
+    tableau = []
+    start = 0
+    for i in range(1, rows + 1):
+        column = tuple(cards[start:start + i])
+        tableau.append(Column(column[:-1], column[-1:]))
+        start += i
+    return State(tuple(tableau), ((),) * FOUNDATIONS, tuple(cards[start:]), ())
+
+
+def can_stack(card, target):
+    return target.value - 1 == card.value and is_red(target) != is_red(card)
+
+
+def moving_cards(state, src, idx):
+    """Return the cards moved from the pile. All of the face-up cards
+       of a tableau column move together.
+    """
+    if src == TABLEAU:
+        return state.tableau[idx].up
+    if src == WASTE:
+        return state.waste[-1:]
+    if src == FOUNDATION:
+        return state.foundations[idx][-1:]
+    return ()
+
+
+def accepts(state, dst, idx, cards):
+    if not cards:
+        return False
+    card = cards[0]
+    if dst == TABLEAU:
+        column = state.tableau[idx]
+        if column.up:
+            return can_stack(card, column.up[-1])
+        return not column.down and card.value == KING
+    if dst == FOUNDATION and len(cards) == 1:
+        if pile := state.foundations[idx]:
+            return card.mark == pile[-1].mark and card.value - 1 == pile[-1].value
+        return card.value == ACE
+    return False
+
+
+def is_legal(state, move):
+    if move == DRAW:
+        return bool(state.stock)
+    if move == RECYCLE:
+        return not state.stock and bool(state.waste)
+    if move.src == move.dst and (move.src_idx == move.dst_idx or move.src == FOUNDATION):
+        return False
+    return accepts(state, move.dst, move.dst_idx, moving_cards(state, move.src, move.src_idx))
+
+
+def is_dead(state):
+    """Return True if cards are stacked in the tableau. They can never be
+       separated again to go to the foundations, so the game is lost.
+    """
+    return any(len(column.up) > 1 for column in state.tableau)
+
+
+def rank(state, move):
+    """Return the score of a move for hints, larger is better, or 0 if
+       the move only shifts cards without opening anything, such as a
+       card taken back from the foundations, which hints would move to
+       the foundations again, or if the move loses the game.
+    """
+    if move in (DRAW, RECYCLE):
+        return 1
+    if move.src == FOUNDATION or is_dead(apply(state, move)):
+        return 0
+    if move.src == WASTE:
+        return 40 if move.dst == FOUNDATION else 30
+    down = len(state.tableau[move.src_idx].down)
+    if down:
+        # a move turning a face-down card, the more cards under it the better.
+        return (70 if move.dst == FOUNDATION else 50) + down
+    return 40 if move.dst == FOUNDATION else 0
+
+
+class MoveFinder:
+    """Keep the legal moves by their source and target piles. apply shares
+       the piles not changed with the state before, so the piles are
+       compared with the last state by identity, and only the moves from
+       and onto the changed piles are found again.
+    """
+
+    def __init__(self, state):
+        self.targets = [(TABLEAU, i) for i in range(len(state.tableau))] + \
+            [(FOUNDATION, i) for i in range(len(state.foundations))]
+        self.sources = [(WASTE, 0)] + self.targets
+        self.state = state
+        # source => {target: Move}
+        self.found = {source: {} for source in self.sources}
+        for source in self.sources:
+            self.find_from(source)
+
+    def find(self, source, target):
+        src, src_idx = source
+        dst, dst_idx = target
+        if src == dst and (src_idx == dst_idx or src == FOUNDATION):
+            return
+        if accepts(self.state, dst, dst_idx, moving_cards(self.state, src, src_idx)):
+            self.found[source][target] = Move(src, src_idx, dst, dst_idx)
+        else:
+            self.found[source].pop(target, None)
+
+    def find_from(self, source):
+        self.found[source].clear()
+        if moving_cards(self.state, *source):
+            for target in self.targets:
+                self.find(source, target)
+
+    def update(self, state, move=None):
+        """Find the moves of the piles changed from the last state, which
+           may be any state of the same deal, as after undo. The move is
+           not needed, but taken as the finders of the other games do.
+        """
+        previous, self.state = self.state, state
+        changed = [(TABLEAU, i) for i, column in enumerate(state.tableau)
+                   if column is not previous.tableau[i]]
+        changed += [(FOUNDATION, i) for i, pile in enumerate(state.foundations)
+                    if pile is not previous.foundations[i]]
+        if state.waste is not previous.waste:
+            changed.append((WASTE, 0))
+        for pile in changed:
+            self.find_from(pile)
+            if pile[0] != WASTE:
+                for source in self.sources:
+                    if source not in changed:
+                        self.find(source, pile)
+
+    def moves(self):
+        moves = [found[target] for found in self.found.values() if found
+                 for target in self.targets if target in found]
+        if self.state.stock:
+            moves.append(DRAW)
+        elif self.state.waste:
+            moves.append(RECYCLE)
+        return moves
+
+    def has_moves(self):
+        return bool(self.state.stock or self.state.waste) or any(self.found.values())
+
+    def best(self):
+        """Return the move of the highest rank, or None if no move but
+           the ones of rank 0 is left.
+        """
+        if moves := self.moves():
+            move = max(moves, key=lambda move: rank(self.state, move))
+            if rank(self.state, move):
+                return move
+        return None
+
+
+def legal_moves(state):
+    return iter(MoveFinder(state).moves())
+
+
+def flip(column):
+    """Turn the top face-down card if no face-up card is left."""
+    if not column.up and column.down:
+        return Column(column.down[:-1], column.down[-1:])
+    return column
+
+
+def apply(state, move):
+    """Return the state after the move. The move must be legal."""
+    if move == DRAW:
+        return state._replace(stock=state.stock[:-1], waste=state.waste + state.stock[-1:])
+    if move == RECYCLE:
+        return state._replace(stock=state.waste[::-1], waste=())
+    tableau = list(state.tableau)
+    foundations = list(state.foundations)
+    waste = state.waste
+    cards = moving_cards(state, move.src, move.src_idx)
+    if move.src == TABLEAU:
+        tableau[move.src_idx] = flip(Column(tableau[move.src_idx].down, ()))
+    elif move.src == WASTE:
+        waste = waste[:-1]
+    else:
+        foundations[move.src_idx] = foundations[move.src_idx][:-1]
+    if move.dst == TABLEAU:
+        column = tableau[move.dst_idx]
+        tableau[move.dst_idx] = Column(column.down, column.up + cards)
+    else:
+        foundations[move.dst_idx] += cards
+    return State(tuple(tableau), tuple(foundations), state.stock, waste)
+
+
+def locate(state, card):
+    """Return (pile, index) of a card which can be picked up, or None."""
+    for i, column in enumerate(state.tableau):
+        if card in column.up:
+            return TABLEAU, i
+    if state.waste and state.waste[-1] == card:
+        return WASTE, 0
+    for i, pile in enumerate(state.foundations):
+        if pile and pile[-1] == card:
+            return FOUNDATION, i
+    return None
+
+
+def is_won(state):
+    return sum(len(pile) for pile in state.foundations) == len(DECK)
+
+
+def auto_complete(state):
+    """Return the moves putting all of the cards left onto the foundations,
+       or None if the game is not won by them alone. Only a state without
+       the stock and face-down cards is tried: no card is hidden any more,
+       so moving any card which the foundations accept never blocks
+       another, and the moves are found in one pass.
+    """
+    if state.stock or any(column.down for column in state.tableau):
+        return None
+    sources = [(WASTE, 0)] + [(TABLEAU, i) for i in range(len(state.tableau))]
+    moves = []
+    while not is_won(state):
+        for src, src_idx in sources:
+            cards = moving_cards(state, src, src_idx)
+            dst_idx = next((i for i in range(len(state.foundations))
+                            if accepts(state, FOUNDATION, i, cards)), None)
+            if dst_idx is not None:
+                break
+        else:
+            return None
+        move = Move(src, src_idx, FOUNDATION, dst_idx)
+        moves.append(move)
+        state = apply(state, move)
+    return moves
+
+
+PILES = (TABLEAU, FOUNDATION, WASTE, STOCK)
+
+
+def encode_move(move):
+    """Return the code of a move, 0 to 1023: the index of the source
+       pile in PILES, its index, and the same of the destination in 2
+       and 3 bits each.
+    """
+    src, src_idx, dst, dst_idx = move
+    return (PILES.index(src) << 3 | src_idx) << 5 | PILES.index(dst) << 3 | dst_idx
+
+
+def decode_move(code):
+    return Move(PILES[code >> 8 & 3], code >> 5 & 7, PILES[code >> 3 & 3], code & 7)
@@ -0,0 +1,127 @@
+"""Depth-first search for a winning sequence of moves in Klonedike.
+
+All of the face-up cards of a column move together and only a single
+card can move onto a foundation, so cards stacked in the tableau can
+never be separated again. Such a state cannot be won, which prunes most
+of the search tree.
+"""
+import time
+from collections import namedtuple
+
+from engine.cards import KING
+from engine.klonedike import (DRAW, FOUNDATION, RECYCLE, TABLEAU, WASTE, Move,
+    accepts, apply, is_dead, is_won)
+
+
+MAX_NODES = 200000
+TIME_LIMIT = 0.5
+SOLVED = 'solved'
+UNSOLVABLE = 'unsolvable'
+UNKNOWN = 'unknown'
+
+
+# status: SOLVED, UNSOLVABLE, or UNKNOWN if the budget ran out.
+Solution = namedtuple('Solution', 'status moves nodes')
+
+
+def talon(state):
+    """Return the stock and the waste cards in the order they are drawn."""
+    return state.waste + state.stock[::-1]
+
+
+def canonical(state):
+    """Return the hashable key shared by the states which differ only
+       in the order of the columns or of the foundations, or in how far
+       the stock has been drawn: every card of the talon can be reached
+       again by drawing and recycling.
+    """
+    tableau = tuple(sorted(state.tableau))
+    foundations = tuple(sorted(pile[-1] for pile in state.foundations if pile))
+    return tableau, foundations, talon(state)
+
+
+def reach(state, idx):
+    """Return the DRAW and RECYCLE moves bringing the idx-th card
+       of the talon to the top of the waste.
+    """
+    top = len(state.waste) - 1
+    if idx >= top:
+        return [DRAW] * (idx - top)
+    return [DRAW] * len(state.stock) + [RECYCLE] + [DRAW] * (idx + 1)
+
+
+def candidate_moves(state):
+    """Return the lists of legal moves worth trying, the most promising
+       first. Only single cards can reach the foundations and moves onto
+       a face-up card are dead ends, so a card is moved only onto the
+       foundations or, for a king covering face-down cards or from the
+       talon, onto the first empty column.
+    """
+    empty_column = next((i for i, column in enumerate(state.tableau)
+                         if not column.down and not column.up), None)
+    to_foundation, to_tableau = [], []
+    for i, column in enumerate(state.tableau):
+        if len(column.up) == 1:
+            if (dst_idx := foundation_for(state, column.up)) is not None:
+                to_foundation.append([Move(TABLEAU, i, FOUNDATION, dst_idx)])
+            if column.up[0].value == KING and column.down and empty_column is not None:
+                to_tableau.append([Move(TABLEAU, i, TABLEAU, empty_column)])
+    for idx, card in enumerate(talon(state)):
+        if (dst_idx := foundation_for(state, (card,))) is not None:
+            to_foundation.append(reach(state, idx) + [Move(WASTE, 0, FOUNDATION, dst_idx)])
+        if card.value == KING and empty_column is not None:
+            to_tableau.append(reach(state, idx) + [Move(WASTE, 0, TABLEAU, empty_column)])
+    return to_foundation + to_tableau
+
+
+def foundation_for(state, cards):
+    """Return the index of the foundation accepting the cards, or None.
+       An ace goes to the first empty foundation.
+    """
+    for i in range(len(state.foundations)):
+        if accepts(state, FOUNDATION, i, cards):
+            return i
+    return None
+
+
+def solve(state, max_nodes=MAX_NODES, time_limit=TIME_LIMIT):
+    """Return the Solution. moves are the legal moves from the state to
+       the won game, including DRAW and RECYCLE.
+    """
+    if is_won(state):
+        return Solution(SOLVED, [], 0)
+    deadline = time.perf_counter() + time_limit
+    seen = {canonical(state)}
+    states = [state]
+    branches = [iter(candidate_moves(state))]
+    path = []
+    nodes = 0
+    while branches:
+        if (moves := next(branches[-1], None)) is None:
+            branches.pop()
+            states.pop()
+            if path:
+                path.pop()
+            continue
+        new_state = states[-1]
+        for move in moves:
+            new_state = apply(new_state, move)
+        if is_dead(new_state) or (key := canonical(new_state)) in seen:
+            continue
+        seen.add(key)
+        path.append(moves)
+        if is_won(new_state):
+            return Solution(SOLVED, [move for moves in path for move in moves], nodes)
+        nodes += 1
+        if nodes >= max_nodes or (nodes % 1024 == 0 and time.perf_counter() > deadline):
+            return Solution(UNKNOWN, [], nodes)
+        states.append(new_state)
+        branches.append(iter(candidate_moves(new_state)))
+    return Solution(UNSOLVABLE, [], nodes)
+
+
+def hint(state, max_nodes=MAX_NODES, time_limit=TIME_LIMIT):
+    """Return the first move of a winning sequence, or None."""
+    if (solution := solve(state, max_nodes, time_limit)).moves:
+        return solution.moves[0]
+    return None
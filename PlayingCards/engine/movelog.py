@@ -0,0 +1,147 @@
+"""The log of the moves played in a deal, to replay and verify them.
+
+    header:  magic, version, the game and the deal number.
+    records: u16 each, appended as the moves are played. A record is
+             the code of a move by encode_move of the engine of the
+             game, or UNDO, or WON written when the game is won.
+A log is complete only with WON; the records of an unfinished game can
+still be replayed up to the last move. Replaying a log needs only the
+engine: the deal is shuffled from the deal number as Deck.shuffle does,
+and each move is checked with is_legal before apply, so thousands of
+logs are verified in a minute.
+"""
+import importlib
+import struct
+from collections import namedtuple
+
+from engine import GAMES
+from engine.seeds import deal
+
+
+MAGIC = b'PLOG'
+VERSION = 1
+HEADER = struct.Struct('<4sB15sQ')
+RECORD = struct.Struct('<H')
+UNDO = 0xFFFE
+WON = 0xFFFF
+
+
+# codes: the records after the header.
+Log = namedtuple('Log', 'game deal_id codes')
+# moves: the moves left after the undone ones, state: the state after them.
+Replay = namedtuple('Replay', 'game deal_id moves undos won state')
+
+
+class MoveLogError(Exception):
+    pass
+
+
+def game_name(engine):
+    return engine.__name__.rpartition('.')[2]
+
+
+def loads(data):
+    try:
+        magic, version, game, deal_id = HEADER.unpack_from(data)
+    except struct.error:
+        raise MoveLogError('The log is truncated.') from None
+    if magic != MAGIC or version != VERSION:
+        raise MoveLogError(f'Not a move log of version {VERSION}.')
+    try:
+        game = game.rstrip(b'\0').decode()
+    except UnicodeDecodeError:
+        raise MoveLogError('The game of the log is broken.') from None
+    # a record half written when the game stopped is left out.
+    end = len(data) - (len(data) - HEADER.size) % RECORD.size
+    codes = [code for code, in RECORD.iter_unpack(data[HEADER.size:end])]
+    return Log(game, deal_id, codes)
+
+
+def read(path):
+    with open(path, 'rb') as f:
+        return loads(f.read())
+
+
+def replay(log):
+    """Play the moves of the log from the deal and return the Replay.
+       Raise MoveLogError at the first record which cannot be played.
+    """
+    if log.game not in GAMES:
+        raise MoveLogError(f'{log.game} is not a game.')
+    engine = importlib.import_module(f'engine.{log.game}')
+    states = [deal(engine, log.deal_id)]
+    undos = 0
+    won = False
+    for i, code in enumerate(log.codes):
+        if won:
+            raise MoveLogError(f'record {i}: the game is already won.')
+        if code == WON:
+            if not engine.is_won(states[-1]):
+                raise MoveLogError(f'record {i}: the game is not won.')
+            won = True
+        elif code == UNDO:
+            if len(states) == 1:
+                raise MoveLogError(f'record {i}: no move to undo.')
+            states.pop()
+            undos += 1
+        else:
+            try:
+                move = engine.decode_move(code)
+                legal = engine.is_legal(states[-1], move)
+            except (IndexError, ValueError):
+                legal = False
+            if not legal:
+                raise MoveLogError(f'record {i}: {code} is not a legal move.')
+            states.append(engine.apply(states[-1], move))
+    return Replay(log.game, log.deal_id, len(states) - 1, undos, won, states[-1])
+
+
+def verify(path):
+    return replay(read(path))
+
+
+class MoveLog:
+    """Append the moves of a deal to a file as they are played.
+       The records are flushed one by one, so that the log of a game
+       which stopped halfway can be replayed to reproduce it.
+    """
+
+    def __init__(self, path, engine, deal_id, append=False):
+        self.engine = engine
+        self.deal_id = deal_id
+        # a new log never overwrites another one.
+        self.file = open(path, 'ab' if append else 'xb')
+        if not append:
+            self.file.write(HEADER.pack(MAGIC, VERSION, game_name(engine).encode(), deal_id))
+            self.file.flush()
+
+    @classmethod
+    def resume(cls, path, engine, deal_id, state):
+        """Return the MoveLog appending to the log of the deal, or None
+           if the log does not replay to the state or is already finished.
+        """
+        try:
+            replayed = verify(path)
+        except (OSError, MoveLogError):
+            return None
+        if replayed.game != game_name(engine) or replayed.deal_id != deal_id \
+                or replayed.won or replayed.state != state:
+            return None
+        return cls(path, engine, deal_id, append=True)
+
+    def write(self, code):
+        self.file.write(RECORD.pack(code))
+        self.file.flush()
+
+    def append(self, move):
+        self.write(self.engine.encode_move(move))
+
+    def undo(self):
+        self.write(UNDO)
+
+    def won(self):
+        self.write(WON)
+        self.close()
+
+    def close(self):
+        self.file.close()
@@ -0,0 +1,185 @@
+from collections import namedtuple
+from itertools import combinations
+
+from engine.cards import KING, JOCKER_VALUE, jockers, standard_deck
+
+
+ROWS = 7
+SIZE = ROWS * (ROWS + 1) // 2
+CLEARED = (1 << SIZE) - 1
+PAIR_TOTAL = 13
+PYRAMID = 'pyramid'
+OPENED = 'opened'
+DISCARD = 'discard'
+JOCKER = 'jocker'
+REMOVE = 'remove'
+
+
+# pyramid: the 28 cards from the top row. removed: bitmask of removed pyramid cards.
+# stock: face-down cards, opened: () or the drawn card, discard: the discarded cards.
+# jockers: the jockers, None after removed. The last card of the piles is on top.
+State = namedtuple('State', 'pyramid removed stock opened discard jockers')
+Location = namedtuple('Location', 'pile idx')
+Move = namedtuple('Move', 'kind locations')
+
+DRAW = Move('draw', ())
+DECK = standard_deck()
+JOCKERS = jockers()
+
+
+def children_masks(rows=ROWS):
+    """Return the bitmask of the two cards covering each pyramid card."""
+    masks = []
+    for row in range(rows):
+        for col in range(row + 1):
+            index = row * (row + 1) // 2 + col
+            if row < rows - 1:
+                masks.append((1 << (index + row + 1)) | (1 << (index + row + 2)))
+            else:
+                masks.append(0)
+    return tuple(masks)
+
+
+def parents_table(children):
+    """Return the indexes of the (at most two) cards covered by each pyramid card."""
+    return tuple(tuple(j for j in range(SIZE) if children[j] >> i & 1) for i in range(SIZE))
+
+
+CHILDREN = children_masks()
+PARENTS = parents_table(CHILDREN)
+# (the first index of the row, the first index of the next row, the mask of the row)
+# of the rows except the bottom row
+ROW_MASKS = tuple((row * (row + 1) // 2, (row + 1) * (row + 2) // 2, (1 << (row + 1)) - 1)
+                  for row in range(ROWS - 1))
+BOTTOM_ROW = CLEARED ^ ((1 << (SIZE - ROWS)) - 1)
+
+
+def deal(cards, jockers=JOCKERS):
+    """cards: the shuffled deck. The first 28 cards make the pyramid
+       and the rest become the stock.
+    """
+    return State(tuple(cards[:SIZE]), 0, tuple(cards[SIZE:]), (), (), tuple(jockers))
+
+
+def is_uncovered(state, index):
+    bit = 1 << index
+    return not state.removed & bit and state.removed & CHILDREN[index] == CHILDREN[index]
+
+
+def uncovered(removed):
+    """Return the mask of the pyramid cards whose two covering cards are removed."""
+    mask = BOTTOM_ROW
+    for start, next_start, row_mask in ROW_MASKS:
+        children = removed >> next_start
+        mask |= (children & children >> 1 & row_mask) << start
+    return mask & ~removed
+
+
+def available(state):
+    """Yield (location, card) of the face-up cards which can be removed."""
+    mask = uncovered(state.removed)
+    while mask:
+        bit = mask & -mask
+        i = bit.bit_length() - 1
+        yield Location(PYRAMID, i), state.pyramid[i]
+        mask ^= bit
+    if state.opened:
+        yield Location(OPENED, 0), state.opened[-1]
+    if state.discard:
+        yield Location(DISCARD, 0), state.discard[-1]
+    for i, card in enumerate(state.jockers):
+        if card:
+            yield Location(JOCKER, i), card
+
+
+def is_removable(*cards):
+    if len(cards) == 1:
+        return cards[0].value == KING
+    if len(cards) == 2:
+        return any(card.value == JOCKER_VALUE for card in cards) or \
+            sum(card.value for card in cards) == PAIR_TOTAL
+    return False
+
+
+def legal_moves(state):
+    cards = list(available(state))
+    for location, card in cards:
+        if is_removable(card):
+            yield Move(REMOVE, (location,))
+    for (loc1, card1), (loc2, card2) in combinations(cards, 2):
+        if is_removable(card1, card2):
+            yield Move(REMOVE, (loc1, loc2))
+    if state.stock:
+        yield DRAW
+
+
+def locate(state, card):
+    for location, available_card in available(state):
+        if available_card == card:
+            return location
+    return None
+
+
+def find_move(state, cards):
+    """Return the move removing the cards, or None if the cards cannot be removed."""
+    locations = tuple(locate(state, card) for card in cards)
+    if None not in locations and len(set(locations)) == len(locations) \
+            and is_removable(*cards):
+        return Move(REMOVE, locations)
+    return None
+
+
+def is_legal(state, move):
+    if move == DRAW:
+        return bool(state.stock)
+    cards = dict(available(state))
+    return all(location in cards for location in move.locations) \
+        and len(set(move.locations)) == len(move.locations) \
+        and is_removable(*(cards[location] for location in move.locations))
+
+
+def apply(state, move):
+    """Return the state after the move. The move must be legal."""
+    if move == DRAW:
+        return state._replace(
+            stock=state.stock[:-1],
+            opened=state.stock[-1:],
+            discard=state.discard + state.opened
+        )
+    removed, opened, discard = state.removed, state.opened, state.discard
+    remaining = list(state.jockers)
+    for pile, idx in move.locations:
+        if pile == PYRAMID:
+            removed |= 1 << idx
+        elif pile == OPENED:
+            opened = ()
+        elif pile == DISCARD:
+            discard = discard[:-1]
+        else:
+            remaining[idx] = None
+    return state._replace(removed=removed, opened=opened, discard=discard, jockers=tuple(remaining))
+
+
+def is_won(state):
+    return state.removed == CLEARED
+
+
+PILES = (PYRAMID, OPENED, DISCARD, JOCKER)
+
+
+def encode_move(move):
+    """Return the code of a move, 0 for DRAW: a byte for each location,
+       the index of the pile in PILES and the index in the pile + 1.
+    """
+    code = 0
+    for pile, idx in move.locations:
+        code = code << 8 | (PILES.index(pile) << 5 | idx) + 1
+    return code << 8 if len(move.locations) == 1 else code
+
+
+def decode_move(code):
+    if not code:
+        return DRAW
+    locations = tuple(Location(PILES[(byte - 1) >> 5], (byte - 1) & 31)
+                      for byte in (code >> 8, code & 0xFF) if byte)
+    return Move(REMOVE, locations)
@@ -0,0 +1,362 @@
+"""Search for a winning sequence of moves in Pyramid.
+
+Whether a deal is winnable is decided by a depth-first search which
+remembers the positions already given up. Every move removes a card or
+draws one, so no position is reached twice on a path and the search
+always ends. It tries the jockers last, so a deal which needs them early
+can keep it busy for long. Then the rest of the budget goes to a search
+taking the position with the fewest cards left first, a jocker left being
+worth JOCKER_WEIGHT cards. Both visit all the positions not given up
+before they tell a deal is unsolvable. The shortest sequence can then be
+searched for best-first with the rest of the budget, which takes far more
+positions.
+
+A position is packed into one int: the 28-bit mask of removed pyramid
+cards, the mask of removed talon cards, the number of removed jockers
+and the number of drawn cards. The talon is the discard pile, the opened
+card and the stock in the order they are drawn. The last drawn card is
+the opened one, and the discard top is the last drawn card before it
+which is not removed.
+
+The jockers are interchangeable, so only their number matters, and a
+position given up is given up with fewer jockers left too. A king in the
+pyramid is removed as soon as it is uncovered: removing it costs the one
+move it needs anyway and only makes more cards available. A position is
+given up when the pyramid cards which have no partner left in the pyramid
+outnumber the talon cards of their partner values and the jockers left:
+every card of the partner value is already removed or lies above or under
+the card in the pyramid. Without jockers, the talon cards discarded under
+a card which has no partner any more are not counted either.
+"""
+import heapq
+import time
+from collections import namedtuple
+
+from engine.cards import KING, JOCKER_VALUE
+from engine.pyramid import (CHILDREN, CLEARED, DISCARD, DRAW, JOCKER, OPENED, PAIR_TOTAL,
+    PYRAMID, REMOVE, SIZE, Location, Move, uncovered)
+
+
+MAX_NODES = 500000
+TIME_LIMIT = 1.0
+# the share of the budget for the depth-first search
+DEPTH_FIRST_SHARE = 0.25
+# the number of pyramid cards a jocker left is worth to the guided search
+JOCKER_WEIGHT = 3
+SOLVED = 'solved'
+UNSOLVABLE = 'unsolvable'
+UNKNOWN = 'unknown'
+TALON_SHIFT = SIZE
+TALON_BITS = 32
+JOCKER_SHIFT = TALON_SHIFT + TALON_BITS
+DRAWN_SHIFT = JOCKER_SHIFT + 3
+
+
+# status: SOLVED, UNSOLVABLE, or UNKNOWN if the budget ran out.
+# minimal: True if the moves are proven to be the fewest.
+Solution = namedtuple('Solution', 'status moves nodes minimal', defaults=(False,))
+
+
+def blocked_masks():
+    """Return the bitmask of the pyramid cards which cannot be removed
+       before each pyramid card is removed.
+    """
+    masks = [0] * SIZE
+    for i in range(SIZE):
+        for j in range(i):
+            if CHILDREN[j] >> i & 1:
+                masks[i] |= 1 << j | masks[j]
+    return tuple(masks)
+
+
+BLOCKED = blocked_masks()
+# the pyramid cards which cannot be paired with each pyramid card:
+# the ones it covers and the ones covering it, never exposed together with it.
+UNPAIRABLE = tuple(BLOCKED[i] | sum(1 << j for j in range(SIZE) if BLOCKED[j] >> i & 1)
+                   for i in range(SIZE))
+PYRAMID_LOCATIONS = tuple(Location(PYRAMID, i) for i in range(SIZE))
+OPENED_LOCATION = Location(OPENED, 0)
+DISCARD_LOCATION = Location(DISCARD, 0)
+
+
+class Position:
+    """Pack and unpack the positions reachable from an engine state."""
+
+    def __init__(self, state):
+        self.pyramid = state.pyramid
+        self.jockers = [i for i, card in enumerate(state.jockers) if card]
+        # a removed placeholder keeps the discard top apart from
+        # the opened card while no card is opened.
+        opened = state.opened or (None,)
+        self.talon = state.discard + opened + state.stock[::-1]
+        talon_removed = 0 if state.opened else 1 << len(state.discard)
+        self.start = self.pack(state.removed, talon_removed, 0, len(state.discard) + 1)
+        # the masks of the pyramid cards and the talon cards by value
+        self.pyramid_values = [0] * (JOCKER_VALUE + 1)
+        self.talon_values = [0] * (JOCKER_VALUE + 1)
+        for i, card in enumerate(self.pyramid):
+            self.pyramid_values[card.value] |= 1 << i
+        for i, card in enumerate(self.talon):
+            if card:
+                self.talon_values[card.value] |= 1 << i
+        self.talon_mask = (1 << len(self.talon)) - 1
+        # removed => the lonely cards of the pyramid left
+        self.lonely_cards = {}
+
+    @staticmethod
+    def pack(removed, talon_removed, jockers_removed, drawn):
+        return removed | talon_removed << TALON_SHIFT \
+            | jockers_removed << JOCKER_SHIFT | drawn << DRAWN_SHIFT
+
+    @staticmethod
+    def unpack(key):
+        return (key & CLEARED,
+                key >> TALON_SHIFT & ((1 << TALON_BITS) - 1),
+                key >> JOCKER_SHIFT & 0b111,
+                key >> DRAWN_SHIFT)
+
+    def available(self, key):
+        """Return [(location, value, key without the card),...] of the removable cards."""
+        removed, talon_removed, jockers_removed, drawn = self.unpack(key)
+        cards = []
+        mask = uncovered(removed)
+        while mask:
+            bit = mask & -mask
+            i = bit.bit_length() - 1
+            cards.append((PYRAMID_LOCATIONS[i], self.pyramid[i].value, key | bit))
+            mask ^= bit
+        opened = drawn - 1
+        if not talon_removed >> opened & 1:
+            cards.append((OPENED_LOCATION, self.talon[opened].value,
+                          key | 1 << (TALON_SHIFT + opened)))
+        for i in range(opened - 1, -1, -1):
+            if not talon_removed >> i & 1:
+                cards.append((DISCARD_LOCATION, self.talon[i].value,
+                              key | 1 << (TALON_SHIFT + i)))
+                break
+        if jockers_removed < len(self.jockers):
+            cards.append((Location(JOCKER, self.jockers[jockers_removed]), JOCKER_VALUE,
+                          key + (1 << JOCKER_SHIFT)))
+        return cards
+
+    def lonely(self, removed):
+        """Return [(partner value, number),...] of the pyramid cards left
+           which have no partner left in the pyramid.
+        """
+        if (lonely := self.lonely_cards.get(removed)) is None:
+            lonely = self.lonely_cards[removed] = []
+            for value in range(1, KING):
+                partners = self.pyramid_values[PAIR_TOTAL - value] & ~removed
+                mask = self.pyramid_values[value] & ~removed
+                count = 0
+                while mask:
+                    bit = mask & -mask
+                    mask ^= bit
+                    if not partners & ~UNPAIRABLE[bit.bit_length() - 1]:
+                        count += 1
+                if count:
+                    lonely.append((PAIR_TOTAL - value, count))
+        return lonely
+
+    def live_talon(self, removed, talon_removed, drawn):
+        """Return the mask of the talon cards which may still be paired without
+           jockers: the cards not drawn yet, and the discarded ones which are
+           not under a card without any partner. Only the top of the discard
+           pile is available, so the discarded cards never pair each other.
+        """
+        left = ~talon_removed & self.talon_mask
+        live = left >> (drawn - 1) << (drawn - 1)
+        partners = 0
+        for value in range(1, JOCKER_VALUE):
+            if self.pyramid_values[value] & ~removed or self.talon_values[value] & live:
+                partners |= 1 << (PAIR_TOTAL - value)
+        for i in range(drawn - 2, -1, -1):
+            if left >> i & 1:
+                live |= 1 << i
+                value = self.talon[i].value
+                if value != KING and not partners >> value & 1:
+                    break
+        return live
+
+    def is_dead(self, key):
+        removed, talon_removed, jockers_removed, drawn = self.unpack(key)
+        if not (lonely := self.lonely(removed)):
+            return False
+        jockers = len(self.jockers) - jockers_removed
+        talon = ~talon_removed if jockers else self.live_talon(removed, talon_removed, drawn)
+        for value, count in lonely:
+            if (jockers := jockers - max(0, count - bin(self.talon_values[value] & talon).count('1'))) < 0:
+                return True
+        return False
+
+    @staticmethod
+    def is_given_up(key, seen):
+        """Return True if the position is in seen with more jockers left."""
+        for _ in range(key >> JOCKER_SHIFT & 0b111):
+            if (key := key - (1 << JOCKER_SHIFT)) in seen:
+                return True
+        return False
+
+    def moves(self, key):
+        """Return [(move, next key),...] of the legal moves worth trying."""
+        cards = self.available(key)
+        for loc, value, new_key in cards:
+            if value == KING and loc.pile == PYRAMID:
+                return [(Move(REMOVE, (loc,)), new_key)]
+        moves, jocker_moves = [], []
+        for i, (loc1, value1, key1) in enumerate(cards):
+            if value1 == KING:
+                moves.append((Move(REMOVE, (loc1,)), key1))
+            for loc2, value2, key2 in cards[i + 1:]:
+                if loc2.pile == JOCKER:
+                    if loc1.pile != JOCKER and value1 != KING:
+                        jocker_moves.append((Move(REMOVE, (loc1, loc2)), key1 + (1 << JOCKER_SHIFT)))
+                elif value1 + value2 == PAIR_TOTAL:
+                    moves.append((Move(REMOVE, (loc1, loc2)), key1 | key2))
+        # the pairs of more pyramid cards first, and the jockers kept to the last.
+        moves.sort(key=lambda move: (-sum(loc.pile == PYRAMID for loc in move[0].locations),
+                                    -any(loc.pile == OPENED for loc in move[0].locations)))
+        if (key >> DRAWN_SHIFT) < len(self.talon):
+            moves.append((DRAW, key + (1 << DRAWN_SHIFT)))
+        return moves + jocker_moves
+
+
+def estimate(position, key):
+    """Return the lower bound of the moves left: a move removes two pyramid
+       cards at most, and only one if it is a king or a lonely card.
+    """
+    removed = key & CLEARED
+    singles = sum(count for _, count in position.lonely(removed)) \
+        + bin(position.pyramid_values[KING] & ~removed).count('1')
+    return singles + (SIZE - bin(removed).count('1') - singles + 1) // 2
+
+
+def priority(position, key):
+    """Return the number of the pyramid cards left, less JOCKER_WEIGHT
+       for each jocker left.
+    """
+    jockers = len(position.jockers) - (key >> JOCKER_SHIFT & 0b111)
+    return SIZE - bin(key & CLEARED).count('1') - JOCKER_WEIGHT * jockers
+
+
+def solve(state, max_nodes=MAX_NODES, time_limit=TIME_LIMIT, shortest=False):
+    """Return the Solution. The depth-first search has DEPTH_FIRST_SHARE of
+       the budget, and the guided search the rest if it runs out. If shortest
+       is True, the moves of a winnable deal are the fewest ones found
+       best-first with the rest of the budget, and minimal of the Solution
+       is True. If the budget runs out first, the moves are the ones found
+       first, which may not be the fewest, and minimal is False.
+    """
+    position = Position(state)
+    if position.start & CLEARED == CLEARED:
+        return Solution(SOLVED, [], 0, True)
+    start = time.perf_counter()
+    deadline = start + time_limit
+    solution = search(position, int(max_nodes * DEPTH_FIRST_SHARE),
+                      start + time_limit * DEPTH_FIRST_SHARE)
+    if solution.status == UNKNOWN:
+        guided = guided_search(position, max_nodes - solution.nodes, deadline)
+        solution = guided._replace(nodes=solution.nodes + guided.nodes)
+    if shortest and solution.status == SOLVED:
+        fewest = shortest_search(position, max_nodes - solution.nodes, deadline)
+        if fewest.status == SOLVED:
+            return fewest._replace(nodes=solution.nodes + fewest.nodes)
+    return solution
+
+
+def search(position, max_nodes, deadline):
+    """Return the Solution found depth-first."""
+    # the positions given up, and the moves tried from the ones on the path.
+    seen = {position.start}
+    branches = [iter(position.moves(position.start))]
+    path = []
+    nodes = 0
+    while branches:
+        if (branch := next(branches[-1], None)) is None:
+            branches.pop()
+            if path:
+                path.pop()
+            continue
+        move, key = branch
+        if key in seen or position.is_given_up(key, seen):
+            continue
+        seen.add(key)
+        if key & CLEARED == CLEARED:
+            return Solution(SOLVED, path + [move], nodes)
+        if position.is_dead(key):
+            continue
+        nodes += 1
+        if nodes >= max_nodes or (nodes % 1024 == 0 and time.perf_counter() > deadline):
+            return Solution(UNKNOWN, [], nodes)
+        path.append(move)
+        branches.append(iter(position.moves(key)))
+    return Solution(UNSOLVABLE, [], nodes)
+
+
+def guided_search(position, max_nodes, deadline):
+    """Return the Solution found taking the position of the lowest priority first."""
+    # parents: key => (previous key, move) of the positions seen
+    parents = {position.start: None}
+    # the later position first among the ones with the same priority.
+    queue = [(0, 0, position.start)]
+    nodes = 0
+    while queue:
+        key = heapq.heappop(queue)[-1]
+        nodes += 1
+        if nodes >= max_nodes or (nodes % 1024 == 0 and time.perf_counter() > deadline):
+            return Solution(UNKNOWN, [], nodes)
+        for move, new_key in position.moves(key):
+            if new_key in parents or position.is_given_up(new_key, parents):
+                continue
+            parents[new_key] = (key, move)
+            if new_key & CLEARED == CLEARED:
+                return Solution(SOLVED, trace(parents, new_key), nodes)
+            if not position.is_dead(new_key):
+                heapq.heappush(queue, (priority(position, new_key), -len(parents), new_key))
+    return Solution(UNSOLVABLE, [], nodes)
+
+
+def shortest_search(position, max_nodes, deadline):
+    """Return the Solution with the fewest moves to clear the pyramid, found best-first."""
+    # parents: key => (previous key, move), costs: key => the number of moves
+    parents = {position.start: None}
+    costs = {position.start: 0}
+    # the deeper position first among the ones with the same estimate.
+    queue = [(estimate(position, position.start), 0, position.start)]
+    nodes = 0
+    while queue:
+        _, cost, key = heapq.heappop(queue)
+        cost = -cost
+        if key & CLEARED == CLEARED:
+            return Solution(SOLVED, trace(parents, key), nodes, True)
+        if cost > costs[key] or position.is_dead(key):
+            continue
+        for move, new_key in position.moves(key):
+            if cost + 1 < costs.get(new_key, cost + 2):
+                costs[new_key] = cost + 1
+                parents[new_key] = (key, move)
+                heapq.heappush(queue, (cost + 1 + estimate(position, new_key), -cost - 1, new_key))
+        nodes += 1
+        if nodes >= max_nodes or (nodes % 1024 == 0 and time.perf_counter() > deadline):
+            return Solution(UNKNOWN, [], nodes)
+    return Solution(UNSOLVABLE, [], nodes)
+
+
+def trace(parents, key):
+    moves = []
+    while parents[key]:
+        key, move = parents[key]
+        moves.append(move)
+    return moves[::-1]
+
+
+def is_stuck(state):
+    """Return True if no card can be removed or drawn any more."""
+    position = Position(state)
+    return not position.moves(position.start)
+
+
+def is_winnable(state, max_nodes=MAX_NODES, time_limit=TIME_LIMIT):
+    """Return True or False, or None if the budget ran out."""
+    status = solve(state, max_nodes, time_limit).status
+    return None if status == UNKNOWN else status == SOLVED
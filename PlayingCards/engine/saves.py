@@ -0,0 +1,151 @@
+"""The binary save of a game in progress.
+
+    header: magic, version, the game, the deal number and the number
+            of the moves played.
+    cards:  the number of the cards, then the codes of the deck in the
+            order dealt.
+    state:  the state of the engine. A tuple of piles is written as the
+            number of the piles followed by the piles, a pile as the
+            number of the cards followed by their codes, and a number
+            as u64.
+A card code is engine.cards.encode of the card, 52 and more for the
+jockers, or EMPTY for an empty place. A save is a few hundred bytes.
+"""
+import os
+import struct
+from collections import namedtuple
+
+from engine.cards import JOCKERS, JOCKER_VALUE, Card, decode, encode
+
+
+MAGIC = b'PSAV'
+VERSION = 1
+HEADER = struct.Struct('<4sB15sQI')
+NUMBER = struct.Struct('<Q')
+EMPTY = 0xFF
+JOCKER_CODE = 52
+
+
+# cards: the cards of the deck in the order dealt, state: the bytes of the state.
+Save = namedtuple('Save', 'game deal_id moves cards state')
+
+
+class SaveError(Exception):
+    pass
+
+
+def card_code(card):
+    if card is None:
+        return EMPTY
+    if card.value == JOCKER_VALUE:
+        return JOCKER_CODE + JOCKERS.index(card.mark)
+    return encode(card)
+
+
+def code_card(code):
+    if code == EMPTY:
+        return None
+    if code >= JOCKER_CODE:
+        if code - JOCKER_CODE >= len(JOCKERS):
+            raise SaveError(f'{code} is not a card.')
+        return Card(JOCKERS[code - JOCKER_CODE], JOCKER_VALUE)
+    return decode(code)
+
+
+def is_pile(value):
+    return not value or not isinstance(value[0], tuple) or isinstance(value[0], Card)
+
+
+def pack_state(value, out):
+    if isinstance(value, int):
+        out += NUMBER.pack(value)
+    elif is_pile(value):
+        out.append(len(value))
+        out += bytes(card_code(card) for card in value)
+    else:
+        out.append(len(value))
+        for item in value:
+            pack_state(item, out)
+
+
+def unpack_state(data, offset, template):
+    """Return the value read in the shape of the template, a state of the
+       same game, and the offset after it.
+    """
+    if isinstance(template, int):
+        return NUMBER.unpack_from(data, offset)[0], offset + NUMBER.size
+    n = data[offset]
+    offset += 1
+    if is_pile(template):
+        cards = tuple(code_card(code) for code in data[offset:offset + n])
+        if len(cards) != n:
+            raise SaveError('The save is truncated.')
+        return cards, offset + n
+    if n != len(template):
+        raise SaveError('The save is of another state.')
+    items = []
+    for item in template:
+        value, offset = unpack_state(data, offset, item)
+        items.append(value)
+    return (type(template)(*items) if hasattr(template, '_fields') else tuple(items)), offset
+
+
+def dumps(game, deal_id, moves, cards, state):
+    """cards: the engine cards of the deck in the order dealt."""
+    out = bytearray(HEADER.pack(MAGIC, VERSION, game.encode(), deal_id, moves))
+    out.append(len(cards))
+    out += bytes(card_code(card) for card in cards)
+    pack_state(state, out)
+    return bytes(out)
+
+
+def loads(data):
+    """Return the Save, whose state is read by read_state."""
+    try:
+        magic, version, game, deal_id, moves = HEADER.unpack_from(data)
+    except struct.error:
+        raise SaveError('The save is truncated.') from None
+    if magic != MAGIC or version != VERSION:
+        raise SaveError(f'Not a save of version {VERSION}.')
+    try:
+        game = game.rstrip(b'\0').decode()
+    except UnicodeDecodeError:
+        raise SaveError('The game of the save is broken.') from None
+    offset = HEADER.size
+    if offset >= len(data) or offset + 1 + data[offset] > len(data):
+        raise SaveError('The save is truncated.')
+    codes = data[offset + 1:offset + 1 + data[offset]]
+    # the decks are dealt without jockers.
+    for code in codes:
+        if code >= JOCKER_CODE:
+            raise SaveError(f'{code} is not a card of the deck.')
+    cards = tuple(decode(code) for code in codes)
+    return Save(game, deal_id, moves, cards, data[offset + 1 + len(cards):])
+
+
+def read_state(save, template):
+    """Return the state of the save in the shape of the template."""
+    try:
+        state, offset = unpack_state(save.state, 0, template)
+    except (IndexError, struct.error):
+        raise SaveError('The save is truncated.') from None
+    if offset != len(save.state):
+        raise SaveError('The save has extra bytes.')
+    return state
+
+
+def write(path, data):
+    """Write the bytes to a temporary file and replace the file with it,
+       so that the file is never left half written.
+    """
+    temp = f'{path}.tmp'
+    with open(temp, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp, path)
+
+
+def read(path):
+    with open(path, 'rb') as f:
+        return loads(f.read())
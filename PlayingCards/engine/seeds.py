@@ -0,0 +1,59 @@
+"""Shuffle the cards from a 64-bit deal number.
+
+random.shuffle may deal other cards from the same seed on another
+version of Python, so deals are shuffled with SplitMix64, which is fixed
+here, and the Fisher-Yates shuffle. The same deal number always makes
+the same layout.
+"""
+import random
+
+
+MASK = (1 << 64) - 1
+GAMMA = 0x9E3779B97F4A7C15
+
+
+class SplitMix64:
+
+    def __init__(self, seed):
+        self.state = seed & MASK
+
+    def next(self):
+        """Return the next 64-bit int."""
+        self.state = (self.state + GAMMA) & MASK
+        z = self.state
+        z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & MASK
+        z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & MASK
+        return z ^ (z >> 31)
+
+    def below(self, n):
+        """Return an int in [0, n) without the bias of the modulo."""
+        limit = MASK + 1 - (MASK + 1) % n
+        while (value := self.next()) >= limit:
+            pass
+        return value % n
+
+
+def new_deal_id():
+    return random.getrandbits(64)
+
+
+def shuffle(cards, deal_id):
+    """Shuffle the list of cards in place in the order of the deal number."""
+    rng = SplitMix64(deal_id)
+    for i in range(len(cards) - 1, 0, -1):
+        j = rng.below(i + 1)
+        cards[i], cards[j] = cards[j], cards[i]
+
+
+def deal(engine, deal_id):
+    """Return the first state of the game of the engine from the deal number."""
+    cards = list(engine.DECK)
+    shuffle(cards, deal_id)
+    return engine.deal(cards)
+
+
+def deal_states(engine, deal_ids):
+    """Return the first states of the deal numbers dealt one by one,
+       as engine.deals.deal_states does at once with NumPy.
+    """
+    return [deal(engine, deal_id) for deal_id in deal_ids]
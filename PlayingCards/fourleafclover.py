@@ -1,8 +1,6 @@
-import tkinter as tk
-from collections import namedtuple
-
-from base import BaseBoard, BaseCard, CardFace, Deck
-from Globals import BOARD_WIDTH, BOARD_HEIGHT, CARD_ROOT, MOVE_SPEED
+from base import BaseBoard, BaseCard, Deck, common_length
+from engine import fourleafclover as engine
+from Globals import BOARD_WIDTH, BOARD_HEIGHT, CARD_ROOT, MOVE_STAGGER
 
 
 CARD_X = int(BOARD_WIDTH / 2) - 150
@@ -12,20 +10,15 @@ STACK_OFFSET = 0.3
 SPACE = 90
 STOCK_X = BOARD_WIDTH - 150
 STOCK_Y = BOARD_HEIGHT - 100
+NO_MOVES = 'No more cards can be removed.'
 
 
 class FourLeafCloverDeck(Deck):
 
-    def __init__(self):
-        super().__init__()
-        self._deck = [card for card in self.get_cards()]
-
     def get_cards(self):
-        for path in self.cards_dir.iterdir():
-            name = path.stem
-            mark, value = name.split('_')
-            if not mark.startswith('jocker') and value != '10':
-                yield CardFace(tk.PhotoImage(file=path), mark, int(value))
+        for face in super().get_cards():
+            if not face.mark.startswith('jocker') and face.value != 10:
+                yield face
 
 
 class CardOnBoard(BaseCard):
@@ -39,6 +32,8 @@ class CardOnBoard(BaseCard):
 
 class Board(BaseBoard):
 
+    engine = engine
+
     def __init__(self, master, status_text, sounds, delay=400, rows=4, columns=4):
         super().__init__(master, status_text, delay, sounds)
         self.rows = rows
@@ -47,23 +42,27 @@ class Board(BaseBoard):
         self.now_moving = False
         self.deck = FourLeafCloverDeck()
 
-    def new_game(self):
-        self.delete('all')
+    def new_game(self, deal_id=None, winnable=False, difficulty=0, cards=None):
+        self.clear()
+        self.now_moving = False
         # config() changes attributes after creating object.
         self.config(width=BOARD_WIDTH, height=BOARD_HEIGHT)
-        self.deck.shuffle()
+        self.shuffle(deal_id, winnable, difficulty, cards)
         self.playing_cards = {}
         sep = self.rows * self.columns
+        self.state = engine.deal([face.card for face in self.deck], sep)
+        self.finder = engine.MoveFinder(self.state)
         self.setup_cards(self.deck[:sep])
         self.setup_stock(self.deck[sep:])
-        for name in self.playing_cards.keys():
-            self.tag_bind(name, '<ButtonPress-1>', self.click)
+        self.cards = {card.card: card for card in self.playing_cards.values()}
+        self.pool.hide_free()
+        self.is_game_end()
 
     def setup_cards(self, cards):
         x, y = CARD_X, CARD_Y
         for i, face in enumerate(cards, 1):
             name = f'card{i}'
-            item_id = self.create_image(x, y, image=face.image, tags=name)
+            item_id = self.pool.take(x, y, face.image, name, self.click)
             card = CardOnBoard(item_id, face, x, y, True, i)
             self.playing_cards[name] = card
             x += SPACE
@@ -75,7 +74,7 @@ class Board(BaseBoard):
         x, y = STOCK_X, STOCK_Y
         for i, face in enumerate(cards):
             name = f'stock{i}'
-            item_id = self.create_image(x, y, image=self.back, tags=name)
+            item_id = self.pool.take(x, y, self.back, name, self.click)
             card = CardOnBoard(item_id, face, x, y)
             self.playing_cards[name] = card
             x += STACK_OFFSET
@@ -95,24 +94,13 @@ class Board(BaseBoard):
     def judge(self, card):
         self.selected.append(card)
         self.update_status()
-        # all marks the same?
-        same = len(set(card.mark for card in self.selected)) == 1
-        # the number of th court cards
-        court_cards = sum(10 < card.value for card in self.selected)
-        # the number of the number cards
-        number_cards = sum(card.value <= 10 for card in self.selected)
-        if not same or (court_cards and number_cards):
-            self.undo()
-        elif court_cards == 3:
+        result = engine.judge([card.card for card in self.selected])
+        if result == engine.INVALID:
+            self.reject()
+        elif result == engine.VALID:
             self.set_new_cards()
-        elif number_cards >= 2:
-            total = sum(card.value for card in self.selected)
-            if total > 15:
-                self.undo()
-            elif total == 15:
-                self.set_new_cards()
-
-    def undo(self):
+
+    def reject(self):
         self.sounds.mistake.play()
         cards = self.selected[0:]
         self.selected = []
@@ -120,49 +108,60 @@ class Board(BaseBoard):
 
     def set_new_cards(self):
         cards = sorted(self.selected, key=lambda x: x.order)
+        # the order of the cards starts from 1.
+        move = engine.Move(tuple(card.order - 1 for card in cards))
+        self.play(move)
+        self.finder.update(self.state, move)
         self.selected = []
         self.after(self.delay, lambda: self.delete_cards(*cards))
         self.after(self.delay, lambda: self.start_move(cards))
 
     def start_move(self, selected_cards):
-        self.destinations = []
         stocks = [card for card in self.playing_cards.values() if not card.face_up]
-        self.move_cards = sorted(
-            stocks, key=lambda x: x.id, reverse=True)[:len(selected_cards)]
-        if self.move_cards:
-            cnt = len(self.move_cards)
-            for stock, card in zip(self.move_cards, selected_cards[:cnt]):
+        move_cards = sorted(stocks, key=lambda x: x.id, reverse=True)[:len(selected_cards)]
+        if move_cards:
+            moves = []
+            for stock, card in zip(move_cards, selected_cards):
                 stock.x, stock.y, stock.order = card.x, card.y, card.order
-                self.destinations.append((card.x, card.y))
-            self.is_moved = False
-            self.idx = 0
+                self.turn_card(stock, True)
+                self.tag_raise(stock.id)
+                moves.append((stock.id, (card.x, card.y), self.sounds.lineup.play))
             self.now_moving = True
-            self.run_move_sequence()
-
-    def run_move_sequence(self):
-        if not self.is_moved:
-            card = self.move_cards[self.idx]
-            if not card.face_up:
-                self.turn_card(card, True)
-                self.tag_raise(card.id)
-            self.move_card(card.id, self.destinations[self.idx])
-            self.after(MOVE_SPEED, self.run_move_sequence)
-        else:
-            self.idx += 1
-            self.sounds.lineup.play()
-            if self.idx < len(self.move_cards):
-                self.is_moved = False
-                self.run_move_sequence()
-            else:
-                self.now_moving = False
+            self.animate(moves, self.end_move, MOVE_STAGGER)
+
+    def layout(self, state, previous=None):
+        for i, card in enumerate(state.slots):
+            if card and (previous is None or previous.slots[i] != card):
+                board_card = self.cards[card]
+                board_card.order = i + 1
+                x = CARD_X + i % self.columns * SPACE
+                y = CARD_Y + i // self.columns * CARD_OFFSET_Y
+                yield board_card, (x, y, True)
+        start = common_length(state.stock, previous.stock) if previous else 0
+        for i in range(start, len(state.stock)):
+            x, y = STOCK_X + i * STACK_OFFSET, STOCK_Y - i * STACK_OFFSET
+            yield self.cards[state.stock[i]], (x, y, False)
+        if previous:
+            left = set(state.slots).union(state.stock[start:])
+            for card in previous.slots + previous.stock[start:]:
+                if card and card not in left:
+                    yield self.cards[card], None
+        self.finder = engine.MoveFinder(state)
 
     def update_status(self):
         text = ', '.join([f'{card.mark} {card.value}' for card in self.selected])
         self.status_text.set(text)
 
+    def show_hint(self):
+        if not self.now_moving and (moves := self.finder.moves()):
+            cards = [self.state.slots[i] for i in moves[0].slots]
+            self.status_text.set(', '.join([f'{card.mark} {card.value}' for card in cards]))
+
     def is_game_end(self):
-        if not [card for card in self.playing_cards.values() if not card.dele]:
+        if engine.is_won(self.state):
             self.sounds.fanfare.play()
+        elif not self.finder.has_moves():
+            self.status_text.set(NO_MOVES)
 
 
 # if __name__ == '__main__':
@@ -1,7 +1,6 @@
-import tkinter as tk
-
-from base import BaseBoard, BaseCard, CardFace, Deck
-from Globals import BOARD_WIDTH, BOARD_HEIGHT, CARD_ROOT, MOVE_SPEED
+from base import BaseBoard, BaseCard, Deck
+from engine import klonedike as engine
+from Globals import BOARD_WIDTH, BOARD_HEIGHT, CARD_ROOT
 
 
 CARD_X = 100
@@ -18,9 +17,10 @@ OPEN_STOCK_X = STOCK_X - (SPACE_X + 10)
 OPEN_STOCK_Y = STOCK_Y
 OPEN_TEMP_X = STOCK_X - SPACE_X
 STACK_OFFSET = 0.3
-RED_COLOR = {'diamond', 'heart'}
-RED = 'red'
-BLACK = 'black'
+# milliseconds to put back all of the opened stock cards
+STOCK_BACK_DURATION = 600
+# milliseconds to put all of the cards left onto the foundations
+AUTO_COMPLETE_DURATION = 1000
 CARD = 'card'
 STOCK = 'stock'
 ACEHOLDER = 'aceholder'
@@ -28,25 +28,22 @@ CARDHOLDER = 'cardholder'
 STOCKHOLDER = 'stockholder'
 OPENEDSTOCK = 'openedstock'
 ACESTOCK = 'acestock'
+DRAW_HINT = 'Draw a card from the stock.'
+RECYCLE_HINT = 'Put the opened cards back to the stock.'
+NO_MOVES = 'No more cards can be moved.'
 
 
 class KlonedikeDeck(Deck):
 
-    def __init__(self):
-        super().__init__()
-        self._deck = [card for card in self.get_cards()]
-
     def get_cards(self):
-        for path in self.cards_dir.iterdir():
-            name = path.stem
-            mark, value = name.split('_')
-            if not mark.startswith('jocker'):
-                yield CardFace(tk.PhotoImage(file=path), mark, int(value))
+        for face in super().get_cards():
+            if not face.mark.startswith('jocker'):
+                yield face
 
 
 class CardOnBoard(BaseCard):
 
-    __slots__ = ('status', 'order', 'col')
+    __slots__ = ('status', 'order', 'col', 'pile')
 
     def __init__(self, item_id, face, status, x, y,
                  face_up=False, order=None, col=None):
@@ -54,29 +51,58 @@ class CardOnBoard(BaseCard):
         self.status = status
         self.order = order
         self.col = col
+        # the Pile in which the card is
+        self.pile = None
 
-    @property
-    def color(self):
-        if self.mark in RED_COLOR:
-            return RED
-        else:
-            return BLACK
+
+class Pile(list):
+    """The cards of a pile from the bottom, with the pile of the engine."""
+
+    __slots__ = ('kind', 'idx')
+
+    def __init__(self, kind, idx=0):
+        super().__init__()
+        self.kind = kind
+        self.idx = idx
+
+    def add(self, *cards):
+        self.extend(cards)
+        for card in cards:
+            card.pile = self
+
+    def take(self, n):
+        """Remove the top n cards and return them."""
+        cards = self[len(self) - n:]
+        del self[len(self) - n:]
+        return cards
+
+
+class Column:
+
+    __slots__ = ('down', 'up')
+
+    def __init__(self, idx):
+        self.down = Pile(engine.TABLEAU, idx)
+        self.up = Pile(engine.TABLEAU, idx)
 
 
 class Holder:
 
-    __slots__ = ('id', 'x', 'y', 'status', 'col')
+    __slots__ = ('id', 'x', 'y', 'status', 'col', 'idx')
 
-    def __init__(self, item_id, x, y, status='holder', col=None):
+    def __init__(self, item_id, x, y, status='holder', col=None, idx=0):
         self.id = item_id
         self.x = x
         self.y = y
         self.status = status
         self.col = col
+        self.idx = idx
 
 
 class Board(BaseBoard):
 
+    engine = engine
+
     def __init__(self, master, status_text, sounds, delay=400, rows=7):
         super().__init__(master, status_text, delay, sounds)
         self.rows = rows
@@ -87,42 +113,48 @@ class Board(BaseBoard):
         self.selected = []
         self.now_moving = False
         self.is_start_horizontal_move = False
-        self.is_start_stock_back = False
         self.holder = self.get_image('holder')
         self.deck = KlonedikeDeck()
 
-    def new_game(self):
-        self.delete('all')
+    def new_game(self, deal_id=None, winnable=False, difficulty=0, cards=None):
+        self.clear()
+        self.now_moving = False
         self.playing_cards = {}
         self.holders = {}
+        self.tableau = [Column(i) for i in range(self.rows)]
+        self.foundations = [Pile(engine.FOUNDATION, i) for i in range(engine.FOUNDATIONS)]
+        self.stock = Pile(engine.STOCK)
+        self.waste = Pile(engine.WASTE)
+        self.pinned = set()
+        self.hinted = []
         # config() changes attributes after creating object.
         self.config(width=BOARD_WIDTH, height=BOARD_HEIGHT)
-        self.deck.shuffle()
+        self.shuffle(deal_id, winnable, difficulty, cards)
+        self.state = engine.deal([face.card for face in self.deck], self.rows)
+        self.finder = engine.MoveFinder(self.state)
         limit = int(self.rows * (self.rows + 1) / 2)  # the number of klondike cards
         self.setup_holder()
         self.setup_cards(self.deck[:limit])
         self.setup_stock(self.deck[limit:])
-        for card in self.playing_cards.values():
-            self.tag_bind(card.id, '<ButtonPress-1>', self.click_card)
-        for holder in self.holders.values():
-            self.tag_bind(holder.id, '<ButtonPress-1>', self.click_holder)
+        self.cards = {card.card: card for card in self.playing_cards.values()}
+        self.pool.hide_free()
 
     def setup_holder(self):
         x, y = CARD_X, CARD_Y
         for i in range(1, 8):
             name = f'{CARDHOLDER}{i}'
-            item_id = self.create_image(x, y, image=self.holder, tags=name)
-            self.holders[name] = Holder(item_id, x, y, status=CARDHOLDER, col=f'col{i}1')
+            item_id = self.pool.take(x, y, self.holder, name, self.click_holder)
+            self.holders[name] = Holder(item_id, x, y, status=CARDHOLDER, col=f'col{i}1', idx=i - 1)
             x += SPACE_X
         # name = 'stockholder'
-        item_id = self.create_image(STOCK_X, STOCK_Y, image=self.holder, tags=STOCKHOLDER)
-        self.tag_bind(STOCKHOLDER, '<ButtonPress-1>', self.start_stock_back)
+        self.pool.take(STOCK_X, STOCK_Y, self.holder, STOCKHOLDER, self.start_stock_back)
         x, y = ACEHOLDER_X, ACEHOLDER_Y
         for i in range(1, 3):
             for j in range(1, 3):
                 name = f'{ACEHOLDER}{i}{j}'
-                item_id = self.create_image(x, y, image=self.holder, tags=name)
-                self.holders[name] = Holder(item_id, x, y, status=ACEHOLDER)
+                item_id = self.pool.take(x, y, self.holder, name, self.click_holder)
+                idx = (i - 1) * 2 + j - 1
+                self.holders[name] = Holder(item_id, x, y, status=ACEHOLDER, idx=idx)
                 x += SPACE_X
             x = ACEHOLDER_X
             y = ACEHOLDER_Y + SPACE_Y
@@ -139,10 +171,12 @@ class Board(BaseBoard):
             for j, face in enumerate(row, 1):
                 face_up = True if j == len(row) else False
                 col = f'col{i}{int(face_up)}'
-                item_id = self.create_image(
-                    x, y, image=face.image if j == len(row) else self.back, tags=col)
+                item_id = self.pool.take(
+                    x, y, face.image if j == len(row) else self.back, col, self.click_card)
                 card = CardOnBoard(item_id, face, CARD, x, y, face_up, col=col)
                 self.playing_cards[item_id] = card
+                column = self.tableau[i - 1]
+                (column.up if face_up else column.down).add(card)
                 y += CARD_OFFSET_Y
             x += SPACE_X
             y = CARD_Y
@@ -151,31 +185,124 @@ class Board(BaseBoard):
         x, y = STOCK_X, STOCK_Y
         for i, face in enumerate(cards, 1):
             name = f'{STOCK}{i}1'
-            item_id = self.create_image(x, y, image=self.back, tags=name)
+            item_id = self.pool.take(x, y, self.back, name, self.click_card)
             card = CardOnBoard(item_id, face, STOCK, x, y, order=i, col=name)
             self.playing_cards[item_id] = card
+            self.stock.add(card)
             x += STACK_OFFSET
             y -= STACK_OFFSET
 
-    def filter(self, func):
-        cards = [card for card in self.playing_cards.values() if func(card)]
-        return cards
+    def pile(self, kind, idx):
+        if kind == engine.TABLEAU:
+            return self.tableau[idx].up
+        if kind == engine.FOUNDATION:
+            return self.foundations[idx]
+        return self.stock if kind == engine.STOCK else self.waste
+
+    def update_piles(self, move):
+        """Move the cards between the piles as the engine does.
+           Return the moved cards and the card to be turned face up or None.
+        """
+        if move == engine.RECYCLE:
+            cards = self.waste.take(len(self.waste))[::-1]
+            self.stock.add(*cards)
+            return cards, None
+        src = self.pile(move.src, move.src_idx)
+        cards = src.take(len(src) if move.src == engine.TABLEAU else 1)
+        self.pile(move.dst, move.dst_idx).add(*cards)
+        if move.src == engine.TABLEAU and not src and (down := self.tableau[move.src_idx].down):
+            opened = down.take(1)[0]
+            src.add(opened)
+            return cards, opened
+        return cards, None
+
+    def layout(self, state, previous=None):
+        for i, column in enumerate(state.tableau):
+            if previous is None or column is not previous.tableau[i]:
+                self.tableau[i] = Column(i)
+                x = CARD_X + i * SPACE_X
+                for j, card in enumerate(column.down + column.up):
+                    face_up = j >= len(column.down)
+                    card = self.place(card, CARD, f'col{i + 1}{int(face_up)}')
+                    (self.tableau[i].up if face_up else self.tableau[i].down).add(card)
+                    yield card, (x, CARD_Y + j * CARD_OFFSET_Y, face_up)
+        for i, pile in enumerate(state.foundations):
+            if previous is None or pile is not previous.foundations[i]:
+                self.foundations[i] = Pile(engine.FOUNDATION, i)
+                holder = self.holders[f'{ACEHOLDER}{i // 2 + 1}{i % 2 + 1}']
+                for card in pile:
+                    card = self.place(card, ACESTOCK)
+                    self.foundations[i].add(card)
+                    yield card, (holder.x, holder.y, True)
+        if previous is None or state.stock is not previous.stock:
+            self.stock = Pile(engine.STOCK)
+            for i, card in enumerate(state.stock):
+                card = self.place(card, STOCK)
+                self.stock.add(card)
+                yield card, (STOCK_X + i * STACK_OFFSET, STOCK_Y - i * STACK_OFFSET, False)
+        if previous is None or state.waste is not previous.waste:
+            self.waste = Pile(engine.WASTE)
+            for i, card in enumerate(state.waste):
+                card = self.place(card, OPENEDSTOCK)
+                self.waste.add(card)
+                yield card, (OPEN_STOCK_X + i * STACK_OFFSET, OPEN_STOCK_Y - i * STACK_OFFSET, True)
+            self.open_stock_x = OPEN_STOCK_X + len(state.waste) * STACK_OFFSET
+            self.open_stock_y = OPEN_STOCK_Y - len(state.waste) * STACK_OFFSET
+        self.finder.update(state)
+
+    def play(self, move):
+        super().play(move)
+        self.finder.update(self.state)
+
+    def place(self, card, status, col=None):
+        """Set the status and the tag of the card of the engine, and return the card on the board.
+           col: the tag of the cards moved together, the card's own tag if None.
+        """
+        card = self.cards[card]
+        card.status = status
+        if col is None:
+            col = f'{ACESTOCK}{card.id}1' if status == ACESTOCK else f'{STOCK}{card.order}1'
+        if card.col != col:
+            self.itemconfig(card.id, tag=col)
+            card.col = col
+        return card
+
+    def to_state(self):
+        """Return the state of the engine made from the piles."""
+        def pile(cards):
+            return tuple(card.card for card in cards)
+        return engine.State(
+            tuple(engine.Column(pile(column.down), pile(column.up)) for column in self.tableau),
+            tuple(pile(foundation) for foundation in self.foundations),
+            pile(self.stock),
+            pile(self.waste)
+        )
+
+    def set_pins(self, *cards):
+        super().set_pins(*cards)
+        self.pinned.update(cards)
+
+    def remove_pins(self, *cards):
+        super().remove_pins(*cards)
+        self.pinned.difference_update(cards)
 
     def click_holder(self, event):
         if not self.now_moving:
+            self.clear_hint()
             holder = self.holders[self.get_tag(event)]
             self.after(self.delay, lambda: self.judge(holder))
 
     def click_card(self, event):
         if not self.now_moving:
+            self.clear_hint()
             card = self.playing_cards[self.get_id(event)]
             if card.status == CARD and card.face_up:
-                cards = self.filter(lambda x: x.col == card.col)
+                cards = card.pile[:]
                 if self.check_pins(card.pin, *cards):
                     self.after(self.delay, lambda: self.judge(cards))
             elif card.status == STOCK and not card.face_up:
-                if not [card for card in self.playing_cards.values() if card.status == OPENEDSTOCK and card.pin]:
-                    self.start_move_stock(card)
+                if not any(card.status == OPENEDSTOCK for card in self.pinned):
+                    self.start_move_stock()
             elif card.status in {OPENEDSTOCK, ACESTOCK}:
                 if self.check_pins(card.pin, card):
                     self.after(self.delay, lambda: self.judge(card))
@@ -188,9 +315,13 @@ class Board(BaseBoard):
         self.selected = []
 
     def start_stock_back(self, event):
-        if cards := self.filter(lambda card: card.status == OPENEDSTOCK):
-            self.is_start_stock_back = True
-            cards.sort(key=lambda x: x.order)
+        # the card drawn last must reach the waste before it goes back.
+        if self.now_moving:
+            return
+        self.clear_hint()
+        if engine.is_legal(self.state, engine.RECYCLE):
+            self.play(engine.RECYCLE)
+            cards, _ = self.update_piles(engine.RECYCLE)
             self.open_stock_x = OPEN_STOCK_X
             self.open_stock_y = OPEN_STOCK_Y
             x, y = STOCK_X, STOCK_Y
@@ -198,15 +329,21 @@ class Board(BaseBoard):
                 card.x, card.y = x, y
                 x += STACK_OFFSET
                 y -= STACK_OFFSET
-            self.sounds.shuffle.play()
-            self.move_start(cards, (OPEN_TEMP_X, STOCK_Y))
-
-    def start_move_stock(self, card):
+            moves = [(card.col, (card.x, card.y), lambda card=card: self.after_stock_moved(card))
+                     for card in cards]
+            self.now_moving = True
+            self.animate_group(moves, STOCK_BACK_DURATION, self.end_move, sound=self.sounds.shuffle)
+
+    def start_move_stock(self):
+        # the top card is drawn wherever the stock is clicked, as the engine does.
+        card = self.stock[-1]
+        self.play(engine.DRAW)
+        self.update_piles(engine.DRAW)
         card.x, card.y = self.open_stock_x, self.open_stock_y
         self.turn_card(card, True)
         self.open_stock_x += STACK_OFFSET
         self.open_stock_y -= STACK_OFFSET
-        self.move_start([card], (OPEN_TEMP_X, STOCK_Y))
+        self.move_start(card, (OPEN_TEMP_X, STOCK_Y))
 
     def start_horizontal_move(self, start, goal):
         self.is_start_horizontal_move = True
@@ -214,52 +351,61 @@ class Board(BaseBoard):
             else (goal.x, goal.y + CARD_OFFSET_Y)
         self.goal_col = f'{ACESTOCK}{start.id}1' if start.status == ACESTOCK else goal.col
         self.tag_raise(start.col)
-        self.move_start([start], destinations)
+        self.move_start(start, destinations)
 
-    def move_start(self, move_cards, destinations):
-        self.move_cards = move_cards
-        self.destinations = destinations
-        self.is_moved = False
-        self.idx = 0
+    def move_start(self, card, destination):
         self.now_moving = True
-        self.run_move_sequence()
-
-    def run_move_sequence(self):
-        if not self.is_moved:
-            self.move_card(self.move_cards[self.idx].col, self.destinations)
-            self.after(MOVE_SPEED, self.run_move_sequence)
-        else:
-            self.after_move_sequence(self.move_cards[self.idx])
-            self.idx += 1
-            if not self.is_start_stock_back:
-                self.sounds.lineup.play()
-            if self.idx < len(self.move_cards):
-                self.is_moved = False
-                self.run_move_sequence()
-            else:
-                if self.is_start_stock_back:
-                    self.is_start_stock_back = False
-                self.now_moving = False
+        self.move_card(card.col, destination, lambda: self.after_move_sequence(card))
 
     def after_move_sequence(self, card):
         if card.status in {OPENEDSTOCK, STOCK}:
             self.after_stock_moved(card)
         else:
             self.after_card_moved(card)
+        self.sounds.lineup.play()
+        self.end_move()
+        if engine.auto_complete(self.state):
+            self.after(self.delay, self.auto_complete)
+
+    def auto_complete(self):
+        """Play all of the moves to the foundations at once, and move the
+           cards home one after another overlapping each other.
+        """
+        if self.now_moving or self.jobs or not (moves := engine.auto_complete(self.state)):
+            return
+        self.clear_hint()
+        self.remove_pins(*self.pinned)
+        self.selected = []
+        cards = []
+        for move in moves:
+            self.play(move)
+            card = self.update_piles(move)[0][0]
+            holder = self.holders[f'{ACEHOLDER}{move.dst_idx // 2 + 1}{move.dst_idx % 2 + 1}']
+            card.x, card.y = holder.x, holder.y
+            self.place(card.card, ACESTOCK)
+            self.tag_raise(card.id)
+            cards.append(card)
+        self.now_moving = True
+        self.animate_group([(card.id, (card.x, card.y), None) for card in cards],
+                           AUTO_COMPLETE_DURATION, self.after_auto_complete,
+                           sound=self.sounds.lineup)
+
+    def after_auto_complete(self):
+        self.end_move()
+        self.is_game_end()
 
     def after_card_moved(self, start):
         start_col = start.col
-        moved_cards = self.filter(lambda card: card.col == start.col)
         self.itemconfig(start.col, tag=self.goal_col)
-        for card in sorted(moved_cards, key=lambda x: x.y):
+        for card in self.moved_cards:
             coords = self.coords(card.id)
             card.x, card.y = int(coords[0]), int(coords[1])
             card.col = self.goal_col
-        if rest_cards := self.filter(lambda card: card.col == start_col[:-1] + '0'):
-            new = max(rest_cards, key=lambda x: x.y)
+        if new := self.opened_card:
             self.itemconfig(new.id, tag=start_col)
             new.col = start_col
             self.after(self.delay - 200, lambda: self.open_one_card(new))
+        self.is_game_end()
 
     def open_one_card(self, card):
         self.sounds.open.play()
@@ -283,53 +429,56 @@ class Board(BaseBoard):
             goal = max(obj2, key=lambda x: x.y) if isinstance(obj2, list) else obj2
             self.update_status((start, goal))
             self.selected = []
-            if isinstance(obj1, list):
-                # card  => card
-                if isinstance(obj2, list):
-                    if goal.value - 1 == start.value and goal.color != start.color:
-                        self.start_horizontal_move(start, goal)
-                # card with value 13 or 1 => cardholder or aceholder
-                elif (start.value == 13 and goal.status == CARDHOLDER) \
-                        or (start.value == 1 and goal.status == ACEHOLDER):
-                    if goal.status == ACEHOLDER:
-                        start.status = ACESTOCK
-                    self.start_horizontal_move(start, goal)
-                # list => onto acestock
-                elif obj2.status == ACESTOCK and len(obj1) == 1:
-                    if start.value - 1 == goal.value and start.mark == goal.mark:
-                        start.status = ACESTOCK
-                        self.start_horizontal_move(start, goal)
-            elif isinstance(obj1, CardOnBoard) and obj1.status == OPENEDSTOCK:
-                # openedstock => card
-                if isinstance(obj2, list):
-                    if goal.value - 1 == start.value and goal.color != start.color:
-                        start.status = CARD
-                        self.start_horizontal_move(start, goal)
-                # openedstock with value 13 or 1 => cardholder or aceholder
-                elif (start.value == 13 and goal.status == CARDHOLDER) \
-                        or (start.value == 1 and goal.status == ACEHOLDER):
-                    start.status = CARD if goal.status == CARDHOLDER else ACESTOCK
-                    self.start_horizontal_move(start, goal)
-                # openedstock => onto acestock
-                elif isinstance(obj2, CardOnBoard) and obj2.status == ACESTOCK:
-                    if start.value - 1 == goal.value and start.mark == goal.mark:
-                        start.status = ACESTOCK
-                        self.start_horizontal_move(start, goal)
-            elif isinstance(obj1, CardOnBoard) and obj1.status == ACESTOCK:
-                # acestock => card
-                if isinstance(obj2, list):
-                    if goal.value - 1 == start.value and goal.color != start.color:
-                        start.status = CARD
-                        self.start_horizontal_move(start, goal)
-                # acestock with value 13 => cardholder
-                elif obj2.status == CARDHOLDER:
-                    if start.value == 13:
-                        start.status = CARD
-                        self.start_horizontal_move(start, goal)
-            if pined_cards := self.filter(lambda card: card.pin):
+            src, dst = self.locate(start), self.locate(goal)
+            if src and dst and engine.is_legal(self.state, move := engine.Move(*src, *dst)):
+                self.play(move)
+                self.moved_cards, self.opened_card = self.update_piles(move)
+                start.status = ACESTOCK if move.dst == engine.FOUNDATION else CARD
+                self.start_horizontal_move(start, goal)
+            if self.pinned:
                 if not self.is_start_horizontal_move:
                     self.sounds.mistake.play()
-                self.remove_pins(*pined_cards)
+                self.remove_pins(*self.pinned)
+
+    def locate(self, item):
+        """Return the pile of the engine to which a card or a holder belongs."""
+        if isinstance(item, Holder):
+            pile = engine.TABLEAU if item.status == CARDHOLDER else engine.FOUNDATION
+            return pile, item.idx
+        pile = item.pile
+        if pile.kind == engine.TABLEAU or pile[-1] is item:
+            return pile.kind, pile.idx
+        return None
+
+    def show_hint(self):
+        """Pin the cards of the best move, the cards to move and the card
+           onto which they go, unless cards are already selected.
+        """
+        if self.now_moving or (self.pinned and not self.hinted):
+            return
+        self.clear_hint()
+        if (move := self.finder.best()) is None:
+            self.status_text.set(NO_MOVES)
+        elif move == engine.RECYCLE:
+            self.status_text.set(RECYCLE_HINT)
+        elif move == engine.DRAW:
+            self.hinted = [self.stock[-1]]
+            self.status_text.set(DRAW_HINT)
+        else:
+            cards = self.pile(move.src, move.src_idx)
+            self.hinted = cards[:] if move.src == engine.TABLEAU else cards[-1:]
+            self.update_status((self.hinted[0], *self.pile(move.dst, move.dst_idx)[-1:]))
+            self.hinted += self.pile(move.dst, move.dst_idx)[-1:]
+        self.set_pins(*self.hinted)
+
+    def clear_hint(self):
+        if self.hinted:
+            self.remove_pins(*self.hinted)
+            self.hinted = []
+
+    def is_game_end(self):
+        if engine.is_won(self.state):
+            self.sounds.fanfare.play()
 
     def update_status(self, items):
         text = ', '.join(
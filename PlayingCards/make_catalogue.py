@@ -0,0 +1,87 @@
+"""Solve a range of deal numbers and write the catalogue of a game.
+
+    python make_catalogue.py pyramid -n 100000
+
+The catalogue is written to catalogues/<game>.cat, where the boards
+find it to deal only winnable games. Only the games with a solver,
+engine.<game>_solver, can be catalogued.
+"""
+import argparse
+import importlib
+import multiprocessing
+import os
+import pathlib
+import sys
+import time
+
+from engine import catalogue
+from Globals import CATALOGUE_ROOT
+from simulate import CHUNK_SIZE, SOLVED_GAMES
+try:
+    from engine.deals import deal_states
+except ImportError:
+    # without NumPy the games are dealt one by one.
+    from engine.seeds import deal_states
+
+
+def catalogue_path(game):
+    return pathlib.Path(__file__).parent.resolve() / CATALOGUE_ROOT / f'{game}.cat'
+
+
+def solve_chunk(args):
+    """Return the Records of the deal numbers in a worker process."""
+    game, deal_ids, max_nodes, time_limit = args
+    engine = importlib.import_module(f'engine.{game}')
+    solver = importlib.import_module(f'engine.{game}_solver')
+    records = []
+    for state in deal_states(engine, deal_ids):
+        solution = solver.solve(state, max_nodes, time_limit)
+        if solution.status == solver.SOLVED:
+            status = catalogue.SOLVED
+        elif solution.status == solver.UNSOLVABLE:
+            status = catalogue.UNSOLVABLE
+        else:
+            status = catalogue.UNKNOWN
+        records.append(catalogue.Record(
+            status, catalogue.difficulty(solution.nodes), min(len(solution.moves), 0xFFFF)))
+    return records
+
+
+def make(game, start, games, path=None, processes=None, chunk_size=CHUNK_SIZE,
+         max_nodes=None, time_limit=None):
+    solver = importlib.import_module(f'engine.{game}_solver')
+    max_nodes = solver.MAX_NODES if max_nodes is None else max_nodes
+    time_limit = solver.TIME_LIMIT if time_limit is None else time_limit
+    path = catalogue_path(game) if path is None else pathlib.Path(path)
+    path.parent.mkdir(exist_ok=True)
+    works = ((game, range(first, min(first + chunk_size, start + games)), max_nodes, time_limit)
+             for first in range(start, start + games, chunk_size))
+    with multiprocessing.Pool(processes) as pool:
+        records = (record for records in pool.imap(solve_chunk, works) for record in records)
+        catalogue.write(path, game, start, records)
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('game', choices=SOLVED_GAMES)
+    parser.add_argument('-n', '--games', type=int, default=1000)
+    parser.add_argument('--start', type=int, default=0, help='the first deal number')
+    parser.add_argument('-o', '--output', help=f'{CATALOGUE_ROOT}/<game>.cat by default')
+    parser.add_argument('-p', '--processes', type=int, default=os.cpu_count())
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    parser.add_argument('--max-nodes', type=int)
+    parser.add_argument('--time-limit', type=float)
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    path = make(args.game, args.start, args.games, args.output, args.processes,
+                args.chunk_size, args.max_nodes, args.time_limit)
+    cat = catalogue.Catalogue(path)
+    print(f'{path}: {cat.solved} of {len(cat)} deals solved '
+          f'in {time.perf_counter() - started:.1f}s')
+    cat.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,7 +1,6 @@
-import tkinter as tk
-
-from base import BaseBoard, BaseCard, CardFace, Deck
-from Globals import BOARD_WIDTH, BOARD_HEIGHT, CARD_ROOT, MOVE_SPEED
+from base import BaseBoard, BaseCard, Deck
+from engine import pyramid as engine
+from Globals import BOARD_WIDTH, BOARD_HEIGHT, CARD_ROOT, MOVE_STAGGER
 
 
 PYRAMID_X = int(BOARD_WIDTH / 2)
@@ -28,30 +27,31 @@ class PyramidDeck(Deck):
 
     def __init__(self):
         super().__init__()
-        self._deck = [card for card in self.get_cards() if not card.mark.startswith(JOCKER)]
-        self.jockers = [card for card in self.get_cards() if card.mark.startswith(JOCKER)]
+        self.jockers = [face for face in super().get_cards() if face.mark.startswith(JOCKER)]
 
     def get_cards(self):
-        for path in self.cards_dir.iterdir():
-            name = path.stem
-            mark, value = name.split('_')
-            yield CardFace(tk.PhotoImage(file=path), mark, int(value))
+        for face in super().get_cards():
+            if not face.mark.startswith(JOCKER):
+                yield face
 
 
 class CardOnBoard(BaseCard):
 
-    __slots__ = ('status', 'left', 'right')
+    __slots__ = ('status', 'parents', 'covered')
 
-    def __init__(self, item_id, face, status, x, y,
-                 face_up=False, left=None, right=None):
+    def __init__(self, item_id, face, status, x, y, face_up=False):
         super().__init__(item_id, face, x, y, face_up)
         self.status = status
-        self.left = left
-        self.right = right
+        # the pyramid cards covered by this card
+        self.parents = ()
+        # the number of the cards covering this card
+        self.covered = 0
 
 
 class Board(BaseBoard):
 
+    engine = engine
+
     def __init__(self, master, status_text, sounds, delay=400, rows=7):
         super().__init__(master, status_text, delay, sounds)
         self.rows = rows
@@ -59,22 +59,26 @@ class Board(BaseBoard):
         self.now_moving = False
         self.deck = PyramidDeck()
 
-    def new_game(self):
-        self.delete('all')
+    def new_game(self, deal_id=None, winnable=False, difficulty=0, cards=None):
+        self.clear()
+        self.now_moving = False
         self.discard_x = DISCARD_X
         self.discard_y = DISCARD_Y
         # config() changes attributes after creating object.
         self.config(width=BOARD_WIDTH, height=BOARD_HEIGHT)
-        self.deck.shuffle()
+        self.shuffle(deal_id, winnable, difficulty, cards)
         self.playing_cards = {}
+        self.pyramid_cards = []
+        self.state = engine.deal(
+            [face.card for face in self.deck], [face.card for face in self.deck.jockers])
         # the number of pyramit cards
         limit = int(self.rows * (self.rows + 1) / 2)
         self.setup_pyramid(self.deck[:limit])
         self.setup_stock(self.deck[limit:])
         self.setup_jocker(self.deck.jockers)
-
-        for name in self.playing_cards.keys():
-            self.tag_bind(name, '<ButtonPress-1>', self.click)
+        self.pyramid_left = len(self.pyramid_cards)
+        self.cards = {card.card: card for card in self.playing_cards.values()}
+        self.pool.hide_free()
 
     def setup_pyramid(self, pyramid_cards):
         # make array as [[1 element], [2 elements], [3 elements],...]
@@ -88,29 +92,25 @@ class Board(BaseBoard):
         for i, row in enumerate(cards, 1):
             for j, face in enumerate(row, 1):
                 name = f'pyramid{i}{j}'
-                item_id = self.create_image(
-                    x, y,
-                    image=face.image if i == self.rows else self.back,
-                    tags=name
-                )
+                item_id = self.pool.take(
+                    x, y, face.image if i == self.rows else self.back, name, self.click)
                 face_up = True if i == self.rows else False
                 card = CardOnBoard(item_id, face, 'pyramid', x, y, face_up)
                 self.playing_cards[name] = card
+                self.pyramid_cards.append(card)
                 x += SPACE
             x -= (SPACE * i) + PYRAMID_OFFSET_X
             y += PYRAMID_OFFSET_Y
-        # set left and right cards
-        for i, row in enumerate(cards[:-1], 1):
-            for j, _ in enumerate(row, 1):
-                card = self.playing_cards[f'pyramid{i}{j}']
-                card.left = self.playing_cards[f'pyramid{i + 1}{j}']
-                card.right = self.playing_cards[f'pyramid{i + 1}{j + 1}']
+        for card, parents in zip(self.pyramid_cards, engine.PARENTS):
+            card.parents = tuple(self.pyramid_cards[i] for i in parents)
+            for parent in card.parents:
+                parent.covered += 1
 
     def setup_stock(self, cards):
         x, y = STOCK_X, STOCK_Y
         for i, face in enumerate(cards):
             name = f'{STOCK}{i}'
-            item_id = self.create_image(x, y, image=self.back, tags=name)
+            item_id = self.pool.take(x, y, self.back, name, self.click)
             card = CardOnBoard(item_id, face, STOCK, x, y)
             self.playing_cards[name] = card
             x += STACK_OFFSET
@@ -120,7 +120,7 @@ class Board(BaseBoard):
         x, y = JOCKER_X, JOCKER_Y
         for i, face in enumerate(jockers):
             name = f'{JOCKER}{i}'
-            item_id = self.create_image(x, y, image=face.image, tags=name)
+            item_id = self.pool.take(x, y, face.image, name, self.click)
             card = CardOnBoard(item_id, face, JOCKER, x, y, True)
             self.playing_cards[name] = card
             x += SPACE
@@ -130,7 +130,7 @@ class Board(BaseBoard):
             card = self.playing_cards[self.get_tag(event)]
             if card.status == STOCK and not card.face_up:
                 if not [card for card in self.playing_cards.values() if card.status == STOCK and card.pin]:
-                    self.start_move(card)
+                    self.start_move()
             elif card.face_up:
                 if not card.pin:
                     self.set_pins(card)
@@ -139,9 +139,11 @@ class Board(BaseBoard):
                     self.remove_pins(card)
                     self.selected = []
 
-    def start_move(self, card):
-        self.destinations = []
-        self.move_cards = []
+    def start_move(self):
+        # the top card is drawn wherever the stock is clicked, as the engine does.
+        card = self.cards[self.state.stock[-1]]
+        self.play(engine.DRAW)
+        moves = []
         if stocks := [stock for stock in self.playing_cards.values() \
                         if stock.status == STOCK and stock.face_up and not stock.dele]:
             stock = stocks[0]
@@ -149,28 +151,52 @@ class Board(BaseBoard):
             self.discard_x += STACK_OFFSET
             self.discard_y -= STACK_OFFSET
             stock.status = DISCARDED
-            self.destinations.append((DISCARD_TEMP_X, OPEN_STOCK_Y))
-            self.move_cards.append(stock)
+            moves.append((stock.id, (DISCARD_TEMP_X, OPEN_STOCK_Y),
+                          lambda: self.after_move_sequence(stock)))
         card.x, card.y = OPEN_STOCK_X, OPEN_STOCK_Y
-        self.destinations.append((OPEN_STOCK_X, OPEN_STOCK_Y))
-        self.move_cards.append(card)
-        self.is_moved = False
-        self.idx = 0
+        moves.append((card.id, (OPEN_STOCK_X, OPEN_STOCK_Y), lambda: self.after_move_sequence(card)))
         self.now_moving = True
-        self.run_move_sequence()
-
-    def run_move_sequence(self):
-        if not self.is_moved:
-            self.move_card(self.move_cards[self.idx].id, self.destinations[self.idx])
-            self.after(MOVE_SPEED, self.run_move_sequence)
-        else:
-            self.after_move_sequence(self.move_cards[self.idx])
-            self.idx += 1
-            if self.idx < len(self.move_cards):
-                self.is_moved = False
-                self.run_move_sequence()
-            else:
-                self.now_moving = False
+        self.animate(moves, self.end_move, MOVE_STAGGER)
+
+    def layout(self, state, previous=None):
+        if previous is None or state.removed != previous.removed:
+            face_up = engine.uncovered(state.removed)
+            for card in self.pyramid_cards:
+                card.covered = 0
+            for i, card in enumerate(self.pyramid_cards):
+                if state.removed >> i & 1:
+                    yield card, None
+                else:
+                    # the pyramid cards are never moved.
+                    yield card, (card.x, card.y, bool(face_up >> i & 1))
+                    for parent in card.parents:
+                        parent.covered += 1
+            self.pyramid_left = engine.SIZE - bin(state.removed).count('1')
+        if previous is None or (state.stock, state.opened, state.discard) != \
+                (previous.stock, previous.opened, previous.discard):
+            for i, card in enumerate(state.stock):
+                card = self.cards[card]
+                card.status = STOCK
+                yield card, (STOCK_X + i * STACK_OFFSET, STOCK_Y - i * STACK_OFFSET, False)
+            for card in state.opened:
+                card = self.cards[card]
+                card.status = STOCK
+                yield card, (OPEN_STOCK_X, OPEN_STOCK_Y, True)
+            for i, card in enumerate(state.discard):
+                card = self.cards[card]
+                card.status = DISCARDED
+                yield card, (DISCARD_X + i * STACK_OFFSET, DISCARD_Y - i * STACK_OFFSET, True)
+            self.discard_x = DISCARD_X + len(state.discard) * STACK_OFFSET
+            self.discard_y = DISCARD_Y - len(state.discard) * STACK_OFFSET
+            if previous:
+                left = set(state.stock + state.opened + state.discard)
+                for card in previous.stock + previous.opened + previous.discard:
+                    if card not in left:
+                        yield self.cards[card], None
+        for i, card in enumerate(state.jockers):
+            if previous is None or card != previous.jockers[i]:
+                jocker = self.playing_cards[f'{JOCKER}{i}']
+                yield jocker, (jocker.x, jocker.y, True) if card else None
 
     def after_move_sequence(self, card):
         if not card.face_up:
@@ -183,28 +209,32 @@ class Board(BaseBoard):
     def judge(self, card):
         self.update_status(card)
         self.selected.append(card)
-        if len(self.selected) == 1 and card.value == 13:
-            self.break_foundation(card)
+        cards = self.selected[0:]
+        if move := engine.find_move(self.state, [card.card for card in cards]):
+            self.play(move)
+            self.break_foundation(*cards)
             self.selected = []
         elif len(self.selected) == 2:
-            cards = self.selected[0:]
-            if sum(card.value == 14 for card in self.selected) >= 1 or \
-                    sum(card.value for card in self.selected) == 13:
-                self.break_foundation(*cards)
-            else:
-                self.after(self.delay, lambda: self.bad_choices(cards))
+            self.after(self.delay, lambda: self.bad_choices(cards))
             self.selected = []
 
     def break_foundation(self, *cards):
+        uncovered = []
+        for card in cards:
+            if card.status == 'pyramid':
+                self.pyramid_left -= 1
+                for parent in card.parents:
+                    parent.covered -= 1
+                    if not parent.covered:
+                        uncovered.append(parent)
         self.after(self.delay, lambda: self.delete_cards(*cards))
-        self.after(self.delay + 200, self.pyramid_face_up)
+        if uncovered:
+            self.after(self.delay + 200, lambda: self.pyramid_face_up(uncovered))
 
-    def pyramid_face_up(self):
-        cards = filter(lambda x: x.right and x.left, self.playing_cards.values())
+    def pyramid_face_up(self, cards):
+        self.sounds.open.play()
         for card in cards:
-            if card.right.dele and card.left.dele and not card.face_up:
-                self.sounds.open.play()
-                self.turn_card(card, True)
+            self.turn_card(card, True)
 
     def update_status(self, card=None):
         val = card.status if card.status == JOCKER else card.value
@@ -219,8 +249,7 @@ class Board(BaseBoard):
         self.status_text.set(status)
 
     def is_game_end(self):
-        if not [card for card in self.playing_cards.values() \
-                    if card.status[:7] == 'pyramid' and not card.dele]:
+        if not self.pyramid_left:
             self.sounds.fanfare.play()
 
 
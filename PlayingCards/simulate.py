@@ -0,0 +1,252 @@
+"""Deal and play many games without the window to collect win rates.
+
+    python simulate.py pyramid -n 1000000 --strategy solver -o pyramid.csv
+
+The games are dealt in the same way as Deck.shuffle and new_game: the
+seeds from --start are the deal numbers shown on the status bar. The
+seeds are split into chunks which are played in a process pool, and the
+results are written to the output, CSV or JSONL by its suffix, as the
+chunks are finished.
+
+A strategy is one of STRATEGIES or 'module:function'. The function is
+called with (engine module, state, random.Random, max_moves) and returns
+(status, the number of moves).
+"""
+import argparse
+import csv
+import importlib
+import json
+import multiprocessing
+import os
+import random
+import sys
+import time
+from collections import namedtuple
+
+from engine import GAMES
+try:
+    from engine.deals import deal_states
+except ImportError:
+    # without NumPy the games are dealt one by one.
+    from engine.seeds import deal_states
+
+
+# the games with a solver, engine.<game>_solver
+SOLVED_GAMES = ('pyramid', 'klonedike')
+WON = 'won'
+LOST = 'lost'
+# the move limit or the budget of the solver ran out.
+UNKNOWN = 'unknown'
+MAX_MOVES = 1000
+CHUNK_SIZE = 100
+FIELDS = ('game', 'seed', 'status', 'moves', 'seconds')
+
+
+Result = namedtuple('Result', FIELDS)
+
+
+def talon_moves(engine):
+    return {getattr(engine, name) for name in ('DRAW', 'RECYCLE') if hasattr(engine, name)}
+
+
+def dead_end(engine):
+    """Return is_dead of the solver of the game, which tells a state
+       from which the game can never be won, or None.
+    """
+    try:
+        solver = importlib.import_module(f'{engine.__name__}_solver')
+    except ImportError:
+        return None
+    return getattr(solver, 'is_dead', None)
+
+
+class Game:
+    """A game played by a strategy. The legal moves are kept by the finder
+       of the engine across the moves, as the boards do, and the game is
+       lost as soon as it can never be won: at a dead state by the solver,
+       or after the talon went round once with no card to move.
+    """
+
+    def __init__(self, engine, state):
+        self.engine = engine
+        self.state = state
+        finder = getattr(engine, 'MoveFinder', None) or getattr(engine, 'PairFinder', None)
+        self.finder = finder(state) if finder else None
+        self.talon_moves = talon_moves(engine)
+        self.is_dead = dead_end(engine)
+        # the talon goes round only in the games recycling the waste.
+        self.recycles = hasattr(engine, 'RECYCLE')
+        # the states in a row in which only the talon could be moved
+        self.idle = 0
+
+    def legal_moves(self):
+        if self.finder:
+            return self.finder.moves()
+        return list(self.engine.legal_moves(self.state))
+
+    def play(self, move):
+        self.state = self.engine.apply(self.state, move)
+        if self.finder:
+            self.finder.update(self.state, move)
+
+    def over(self, legal):
+        """Return WON or LOST if the game is over, or None.
+           legal: the legal moves of the state.
+        """
+        if self.engine.is_won(self.state):
+            return WON
+        if not legal or (self.is_dead and self.is_dead(self.state)):
+            return LOST
+        if self.recycles and all(move in self.talon_moves for move in legal):
+            self.idle += 1
+            # every state of the talon was seen, DRAW to each card and RECYCLE.
+            if self.idle > len(self.state.stock) + len(self.state.waste):
+                return LOST
+        else:
+            self.idle = 0
+        return None
+
+
+def play_random(engine, state, rnd, max_moves):
+    """Play one of the legal moves at random."""
+    game = Game(engine, state)
+    for moves in range(max_moves):
+        legal = game.legal_moves()
+        if status := game.over(legal):
+            return status, moves
+        game.play(rnd.choice(legal))
+    return WON if engine.is_won(game.state) else UNKNOWN, max_moves
+
+
+def play_greedy(engine, state, rnd, max_moves):
+    """Play the first legal move, drawing from the stock only
+       when no card can be moved. The play is the same from the same
+       state, so the game is lost when a state comes round again.
+    """
+    game = Game(engine, state)
+    seen = set()
+    for moves in range(max_moves):
+        legal = game.legal_moves()
+        if status := game.over(legal):
+            return status, moves
+        if game.state in seen:
+            return LOST, moves
+        seen.add(game.state)
+        game.play(next((move for move in legal if move not in game.talon_moves), legal[0]))
+    return WON if engine.is_won(game.state) else UNKNOWN, max_moves
+
+
+def play_solver(engine, state, rnd, max_moves):
+    """Play the solution found by the solver of the game."""
+    solver = importlib.import_module(f'{engine.__name__}_solver')
+    solution = solver.solve(state)
+    if solution.status == solver.SOLVED:
+        return WON, len(solution.moves)
+    return LOST if solution.status == solver.UNSOLVABLE else UNKNOWN, 0
+
+
+STRATEGIES = {
+    'random': play_random,
+    'greedy': play_greedy,
+    'solver': play_solver,
+}
+
+
+def get_strategy(name):
+    if name in STRATEGIES:
+        return STRATEGIES[name]
+    module, _, func = name.partition(':')
+    return getattr(importlib.import_module(module), func)
+
+
+def play_chunk(args):
+    """Play the games of the seeds in a worker process."""
+    game, strategy, deal_ids, max_moves = args
+    engine = importlib.import_module(f'engine.{game}')
+    play = get_strategy(strategy)
+    results = []
+    for seed, state in zip(deal_ids, deal_states(engine, deal_ids)):
+        start = time.perf_counter()
+        status, moves = play(engine, state, random.Random(seed), max_moves)
+        results.append(Result(game, seed, status, moves, round(time.perf_counter() - start, 6)))
+    return results
+
+
+def chunks(game, strategy, start, games, chunk_size, max_moves):
+    for first in range(start, start + games, chunk_size):
+        deal_ids = range(first, min(first + chunk_size, start + games))
+        yield game, strategy, deal_ids, max_moves
+
+
+class Output:
+    """Write the results to a CSV or JSONL file, or nowhere.
+       fields: the header of the CSV file.
+    """
+
+    def __init__(self, path, fields=FIELDS):
+        self.file = None
+        self.writer = None
+        if path:
+            self.file = open(path, 'w', newline='')
+            if path.endswith('.jsonl'):
+                self.write = self.write_json
+            else:
+                self.writer = csv.writer(self.file)
+                self.writer.writerow(fields)
+
+    def write(self, result):
+        if self.writer:
+            self.writer.writerow(result)
+
+    def write_json(self, result):
+        self.file.write(json.dumps(result._asdict()) + '\n')
+
+    def close(self):
+        if self.file:
+            self.file.close()
+
+
+def simulate(game, strategy, start, games, output=None, processes=None,
+             chunk_size=CHUNK_SIZE, max_moves=MAX_MOVES):
+    """Return {status: the number of games}."""
+    counts = dict.fromkeys((WON, LOST, UNKNOWN), 0)
+    out = Output(output)
+    try:
+        with multiprocessing.Pool(processes) as pool:
+            works = chunks(game, strategy, start, games, chunk_size, max_moves)
+            for results in pool.imap(play_chunk, works):
+                for result in results:
+                    counts[result.status] += 1
+                    out.write(result)
+    finally:
+        out.close()
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('game', choices=GAMES)
+    parser.add_argument('-n', '--games', type=int, default=1000)
+    parser.add_argument('--start', type=int, default=0, help='the first seed')
+    parser.add_argument('-s', '--strategy', default='greedy',
+                        help=f"{', '.join(STRATEGIES)} or module:function")
+    parser.add_argument('-o', '--output', help='a .csv or .jsonl file')
+    parser.add_argument('-p', '--processes', type=int, default=os.cpu_count())
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    parser.add_argument('--max-moves', type=int, default=MAX_MOVES)
+    args = parser.parse_args(argv)
+    if args.strategy == 'solver' and args.game not in SOLVED_GAMES:
+        parser.error(f"the solver strategy needs one of {', '.join(SOLVED_GAMES)}, "
+                     f"as no engine.{args.game}_solver exists")
+
+    started = time.perf_counter()
+    counts = simulate(args.game, args.strategy, args.start, args.games, args.output,
+                      args.processes, args.chunk_size, args.max_moves)
+    elapsed = time.perf_counter() - started
+    print(f'{args.game} {args.strategy}: {args.games} games in {elapsed:.1f}s')
+    for status, count in counts.items():
+        print(f'  {status}: {count} ({count / max(args.games, 1):.2%})')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,95 @@
+"""Replay the move logs of the boards without the window and verify them.
+
+    python verify.py logs/*.log --won -o verified.jsonl
+
+Each log is replayed on the engine of its game from the deal number:
+every move must be legal, and WON must be recorded where the game is
+won. The logs are split into chunks which are verified in a process
+pool. The results are written to the output, CSV or JSONL by its suffix,
+and the command exits with 1 if any log is invalid.
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+from collections import namedtuple
+
+from engine import movelog
+from simulate import Output
+
+
+CHUNK_SIZE = 100
+VALID = 'valid'
+INVALID = 'invalid'
+# the log has no WON though --won is given.
+UNFINISHED = 'unfinished'
+FIELDS = ('path', 'game', 'seed', 'status', 'moves', 'undos', 'won', 'error')
+
+
+Result = namedtuple('Result', FIELDS)
+
+
+def verify_chunk(args):
+    """Verify the logs in a worker process."""
+    paths, won = args
+    results = []
+    for path in paths:
+        try:
+            replay = movelog.verify(path)
+        except (OSError, movelog.MoveLogError) as e:
+            results.append(Result(path, '', None, INVALID, 0, 0, False, str(e)))
+            continue
+        # a log breaking the replay otherwise is invalid by itself,
+        # and the other logs of the chunk are still verified.
+        except Exception as e:
+            results.append(Result(path, '', None, INVALID, 0, 0, False, f'{type(e).__name__}: {e}'))
+            continue
+        status = UNFINISHED if won and not replay.won else VALID
+        results.append(Result(path, replay.game, replay.deal_id, status,
+                              replay.moves, replay.undos, replay.won, ''))
+    return results
+
+
+def chunks(paths, chunk_size, won):
+    for first in range(0, len(paths), chunk_size):
+        yield paths[first:first + chunk_size], won
+
+
+def verify(paths, won=False, output=None, processes=None, chunk_size=CHUNK_SIZE):
+    """Return {status: the number of logs}, printing the logs not valid."""
+    counts = dict.fromkeys((VALID, UNFINISHED, INVALID), 0)
+    out = Output(output, FIELDS)
+    try:
+        with multiprocessing.Pool(processes) as pool:
+            for results in pool.imap(verify_chunk, chunks(paths, chunk_size, won)):
+                for result in results:
+                    counts[result.status] += 1
+                    if result.status != VALID:
+                        print(f'{result.path}: {result.status} {result.error}')
+                    out.write(result)
+    finally:
+        out.close()
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('logs', nargs='+')
+    parser.add_argument('--won', action='store_true', help='the games must be won')
+    parser.add_argument('-o', '--output', help='a .csv or .jsonl file')
+    parser.add_argument('-p', '--processes', type=int, default=os.cpu_count())
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    counts = verify(args.logs, args.won, args.output, args.processes, args.chunk_size)
+    elapsed = time.perf_counter() - started
+    print(f'{len(args.logs)} logs in {elapsed:.1f}s')
+    for status, count in counts.items():
+        print(f'  {status}: {count}')
+    return 1 if counts[INVALID] or counts[UNFINISHED] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
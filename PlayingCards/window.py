@@ -1,50 +1,143 @@
+import importlib
 import os
 import pathlib
+import threading
+import time
 import tkinter as tk
 import tkinter.ttk as ttk
+from tkinter import simpledialog
 
-import pygame
-
-import couple
-import fourleafclover
-import klonedike
-import pyramid
 import rules
-from Globals import (PAD, IMAGE_ROOT, CLOSE, PYRAMID, RELOAD, CLOVER, RULES,
-    KLONEDIKE, COUPLE, DISAPPEAR, LINEUP, MISTAKE, SHUFFLE, OPEN, CHANGE, FANFARE)
+from Globals import (PAD, IMAGE_ROOT, CLOSE, PYRAMID, RELOAD, CLOVER, RULES, DEAL,
+    WINNABLE, DIFFICULTY, UNDO, REDO, HINT, KLONEDIKE, COUPLE, DISAPPEAR, LINEUP, MISTAKE, SHUFFLE, OPEN,
+    CHANGE, FANFARE, SILENT_ENV)
+
+
+GAME_MODULES = {
+    PYRAMID: 'pyramid',
+    CLOVER: 'fourleafclover',
+    KLONEDIKE: 'klonedike',
+    COUPLE: 'couple',
+}
+
+
+class SoundEffect:
+    """Decode a wav file at the first play or by the background preload.
+       play() is silently ignored until the mixer is ready.
+    """
 
+    def __init__(self, file):
+        self.file = file
+        self.mixer = None
+        self.sound = None
+        self.lock = threading.Lock()
 
-pygame.init()
+    def load(self):
+        # never wait for the preload thread: the request is dropped instead.
+        if self.mixer and self.lock.acquire(blocking=False):
+            try:
+                if self.sound is None:
+                    self.sound = self.mixer.Sound(self.file)
+            finally:
+                self.lock.release()
+        return self.sound
+
+    def play(self):
+        if sound := self.sound or self.load():
+            sound.play()
 
 
 class Sounds:
+    """audio: if False, no sound is played and pygame is never imported.
+    """
 
-    def __init__(self):
+    def __init__(self, audio=True):
+        self.audio = audio
         self.create_sound_effect()
 
     def create_sound_effect(self):
-        self.disappear = pygame.mixer.Sound(DISAPPEAR)
-        self.lineup = pygame.mixer.Sound(LINEUP)
-        self.mistake = pygame.mixer.Sound(MISTAKE)
-        self.shuffle = pygame.mixer.Sound(SHUFFLE)
-        self.open = pygame.mixer.Sound(OPEN)
-        self.change = pygame.mixer.Sound(CHANGE)
-        self.fanfare = pygame.mixer.Sound(FANFARE)
+        self.disappear = SoundEffect(DISAPPEAR)
+        self.lineup = SoundEffect(LINEUP)
+        self.mistake = SoundEffect(MISTAKE)
+        self.shuffle = SoundEffect(SHUFFLE)
+        self.open = SoundEffect(OPEN)
+        self.change = SoundEffect(CHANGE)
+        self.fanfare = SoundEffect(FANFARE)
+
+    @property
+    def effects(self):
+        return (self.disappear, self.lineup, self.mistake, self.shuffle,
+                self.open, self.change, self.fanfare)
+
+    def start(self):
+        if self.audio:
+            thread = threading.Thread(target=self.setup_mixer, daemon=True)
+            thread.start()
+
+    def setup_mixer(self):
+        try:
+            import pygame
+        except ImportError:
+            return
+        try:
+            # initialize only the mixer, not all of the pygame modules.
+            pygame.mixer.init()
+        except pygame.error:
+            return
+        for effect in self.effects:
+            effect.mixer = pygame.mixer
+        for effect in self.effects:
+            effect.load()
+
+
+class BoardRegistry:
+    """Import a game module and build its board at the first request.
+       The built boards are cached, and the time spent to build each of
+       them is kept in build_times.
+    """
+
+    def __init__(self, container, status_text, sounds):
+        self.container = container
+        self.status_text = status_text
+        self.sounds = sounds
+        self.boards = {}
+        self.build_times = {}
+
+    def __getitem__(self, name):
+        if name not in self.boards:
+            self.boards[name] = self.build(name)
+        return self.boards[name]
+
+    def build(self, name):
+        start = time.perf_counter()
+        module = importlib.import_module(GAME_MODULES[name])
+        frame = tk.Frame(self.container)
+        frame.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+        game = module.Board(frame, self.status_text, self.sounds)
+        game.pack(fill=tk.BOTH, expand=True)
+        self.build_times[name] = time.perf_counter() - start
+        return frame, game
 
 
 class Window(ttk.Frame):
+    """audio: if False, or if the environment variable SILENT_ENV is set,
+       the window is silent, as on a machine without an audio device.
+    """
 
-    def __init__(self, master):
+    def __init__(self, master, audio=True):
         super().__init__(master, padding=PAD)
-        self.sounds = Sounds()
+        self.sounds = Sounds(audio and not os.environ.get(SILENT_ENV))
         self.create_variables()
         self.create_images()
         self.create_ui()
+        # start the mixer after the first frame is drawn.
+        self.after_idle(self.sounds.start)
 
     def create_variables(self):
-        self.games = {}
         self.images = {}
         self.status_text = tk.StringVar()
+        self.winnable = tk.BooleanVar()
+        self.difficulty = 0
         self.rule = None
 
     def create_images(self):
@@ -58,6 +151,9 @@ class Window(ttk.Frame):
         self.create_board()
         self.create_menubar()
         self.create_statusbar()
+        self.master.bind_all('<Control-z>', self.undo)
+        self.master.bind_all('<Control-y>', self.redo)
+        self.master.bind_all('<Control-h>', self.hint)
         self.change_board(PYRAMID)
 
     def create_board(self):
@@ -65,13 +161,7 @@ class Window(ttk.Frame):
         container.pack(fill=tk.BOTH, expand=True)
         container.grid_rowconfigure(0, weight=1)
         container.grid_columnconfigure(0, weight=1)
-        for name, module in zip((PYRAMID, CLOVER, KLONEDIKE, COUPLE),
-                                (pyramid, fourleafclover, klonedike, couple)):
-            frame = tk.Frame(container)
-            frame.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
-            game = module.Board(frame, self.status_text, self.sounds)
-            game.pack(fill=tk.BOTH, expand=True)
-            self.games[name] = (frame, game)
+        self.games = BoardRegistry(container, self.status_text, self.sounds)
 
     def create_menubar(self):
         self.menubar = tk.Menu(self.master)
@@ -89,6 +179,14 @@ class Window(ttk.Frame):
                              compound=tk.LEFT, image=self.images[KLONEDIKE])
         gamemenu.add_command(label=COUPLE, command=lambda: self.change_board(COUPLE),
                              compound=tk.LEFT, image=self.images[COUPLE])
+        gamemenu.add_separator()
+        gamemenu.add_command(label=UNDO, command=self.undo, accelerator='Ctrl+Z')
+        gamemenu.add_command(label=REDO, command=self.redo, accelerator='Ctrl+Y')
+        gamemenu.add_command(label=HINT, command=self.hint, accelerator='Ctrl+H')
+        gamemenu.add_separator()
+        gamemenu.add_command(label=f'{DEAL}...', command=self.select_deal)
+        gamemenu.add_checkbutton(label=WINNABLE, variable=self.winnable)
+        gamemenu.add_command(label=f'{DIFFICULTY}...', command=self.select_difficulty)
         gamemenu.add_command(label=CLOSE, command=self.close,
                              compound=tk.LEFT, image=self.images[CLOSE])
         self.menubar.add_cascade(label="Game", menu=gamemenu)
@@ -112,14 +210,42 @@ class Window(ttk.Frame):
         flame, board = self.games[board_name]
         flame.tkraise()
         self.board = board
-        self.new_game()
+        # keep the game in progress, or resume the one saved when closed
+        if board.state is not None:
+            self.status_text.set(f'{DEAL} {board.deal_id}')
+        elif not board.resume():
+            self.new_game()
         if self.rule:
             self.rule.switch_text(self.board.__module__)
 
-    def new_game(self):
+    def new_game(self, deal_id=None):
         self.sounds.change.play()
         self.status_text.set('')
-        self.board.new_game()
+        self.board.new_game(deal_id, self.winnable.get(), self.difficulty)
+
+    def undo(self, event=None):
+        self.board.undo_move()
+
+    def redo(self, event=None):
+        self.board.redo_move()
+
+    def hint(self, event=None):
+        self.board.show_hint()
+
+    def select_deal(self):
+        """Play the deal of the number entered."""
+        deal_id = simpledialog.askinteger(
+            DEAL, 'Deal number:', parent=self.master, minvalue=0, maxvalue=2 ** 64 - 1)
+        if deal_id is not None:
+            self.new_game(deal_id)
+
+    def select_difficulty(self):
+        """Deal only the games of the difficulty or more in the catalogue."""
+        difficulty = simpledialog.askinteger(
+            DIFFICULTY, 'Minimum difficulty (0-255):', parent=self.master,
+            initialvalue=self.difficulty, minvalue=0, maxvalue=255)
+        if difficulty is not None:
+            self.difficulty = difficulty
 
     def show_rules(self):
         if self.rule is None:
@@ -128,6 +254,13 @@ class Window(ttk.Frame):
             self.rule.deiconify()
 
     def close(self, event=None):
+        for _, board in self.games.boards.values():
+            # a board which cannot be saved does not keep the others from closing.
+            try:
+                board.save()
+            except OSError:
+                pass
+            board.close_log()
         self.quit()
 
 